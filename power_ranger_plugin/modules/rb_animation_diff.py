@@ -0,0 +1,257 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+"""
+
+import os, json, hashlib
+import c4d
+from c4d import documents
+import rb_functions
+
+config = rb_functions.get_config_values()
+debug = bool(int(config.get(rb_functions.CONFIG_SECTION, 'debug')))
+verbose = bool(int(config.get(rb_functions.CONFIG_SECTION, 'verbose')))
+
+SNAPSHOT_FOLDER = rb_functions.__root__ + '/config/snapshots'
+
+# Snapshot entry keys
+SNAP_DIGEST = 'digest'
+SNAP_KEYS = 'keys'
+
+# Track states of the last snapshot, keyed on (document name, track key).
+# Each entry holds the track dirty count and the snapshot entry built from it,
+# so that a track which has not been touched is not hashed a second time.
+_trackCache = {}
+
+# ===================================================================
+def get_snapshotFullPath(doc):
+# ===================================================================
+    # Builds the snapshot file name for the project
+    # .............................................
+    projectName = doc.GetDocumentName().replace('.c4d', '')
+
+    return os.path.join(SNAPSHOT_FOLDER, projectName + '.json')
+
+# ===================================================================
+def make_unique_path(path, seenPaths):
+# ===================================================================
+    # Names need not be unique, e.g. two sibling Cubes, so the second and
+    # later nodes with the same path get an index, e.g. obj:/Cube[1]
+    # ..................................................................
+    count = seenPaths.get(path, 0)
+    seenPaths[path] = count + 1
+
+    return path if 0 == count else path + '[' + str(count) + ']'
+
+# ===================================================================
+def iterate_hierarchy(node, parentPath, seenPaths=None):
+# ===================================================================
+    # Walks a list of sibling nodes and their children, yielding each
+    # node with a unique path built from the names of its ancestors
+    # ...............................................................
+    if seenPaths is None:
+        seenPaths = {}
+    while node is not None:
+        path = make_unique_path(parentPath + '/' + node.GetName(), seenPaths)
+        yield path, node
+        for childPath, child in iterate_hierarchy(node.GetDown(), path, seenPaths):
+            yield childPath, child
+        node = node.GetNext()
+
+# ===================================================================
+def iterate_animated_nodes(doc):
+# ===================================================================
+    # Yields every node in the document which can carry animation tracks:
+    # objects and their tags, materials and the overrides held by takes.
+    # Each node has a unique path, even where names are repeated
+    # ....................................................................
+    seenPaths = {}
+    for path, obj in iterate_hierarchy(doc.GetFirstObject(), 'obj:', seenPaths):
+        yield path, obj
+        for tag in obj.GetTags():
+            yield make_unique_path(path + '#' + tag.GetName(), seenPaths), tag
+
+    material = doc.GetFirstMaterial()
+    while material is not None:
+        yield make_unique_path('mat:/' + material.GetName(), seenPaths), material
+        material = material.GetNext()
+
+    takeData = doc.GetTakeData()
+    if takeData is None:
+        return
+    for path, take in iterate_hierarchy(takeData.GetMainTake(), 'take:', seenPaths):
+        for override in take.GetOverrides():
+            sceneNode = override.GetSceneNode()
+            if sceneNode is None:
+                continue
+            yield make_unique_path(path + '>' + sceneNode.GetName(), seenPaths), override
+
+# ===================================================================
+def get_trackState(track, fps):
+# ===================================================================
+    # Returns the list of key states of the track, each one as
+    # [frame, value, interpolation, left tangent, right tangent]
+    # ........................................................
+    curve = track.GetCurve()
+    keys = []
+    for idx in range(curve.GetKeyCount()):
+        key = curve.GetKey(idx)
+        keys.append([
+            key.GetTime().GetFrame(fps),
+            key.GetValue(),
+            key.GetInterpolation(),
+            key.GetValueLeft(),
+            key.GetValueRight()
+        ])
+
+    return keys
+
+# ===================================================================
+def snapshot_tracks(doc):
+# ===================================================================
+    # Builds a snapshot of every animation track in the document.
+    # Tracks whose dirty count has not moved since the last snapshot
+    # reuse the cached entry rather than being hashed again
+    # ..............................................................
+    fps = doc.GetFps()
+    docName = doc.GetDocumentName()
+    snapshot = {}
+    seenKeys = {}
+    for nodePath, node in iterate_animated_nodes(doc):
+        for track in node.GetCTracks():
+            trackKey = make_unique_path(nodePath + '|' + track.GetName(), seenKeys)
+            dirty = track.GetDirty(c4d.DIRTYFLAGS_DATA)
+
+            cached = _trackCache.get((docName, trackKey))
+            if cached is not None and cached[0] == dirty:
+                snapshot[trackKey] = cached[1]
+                continue
+
+            if True == verbose:
+                print("Hashing track: " + trackKey)
+            keys = get_trackState(track, fps)
+            entry = {
+                SNAP_DIGEST: hashlib.md5(json.dumps(keys).encode('utf-8')).hexdigest(),
+                SNAP_KEYS: keys
+            }
+            _trackCache[(docName, trackKey)] = (dirty, entry)
+            snapshot[trackKey] = entry
+
+    return snapshot
+
+# ===================================================================
+def load_snapshot(doc):
+# ===================================================================
+    # Returns the snapshot saved for the project, or None if there isn't one
+    # ......................................................................
+    snapshotFile = get_snapshotFullPath(doc)
+    if False == os.path.isfile(snapshotFile):
+        return None
+
+    with open(snapshotFile, 'r') as inFile:
+        return json.load(inFile)
+
+# ===================================================================
+def save_snapshot(doc, snapshot):
+# ===================================================================
+    # Writes the snapshot for the project
+    # ...................................
+    if False == os.path.isdir(SNAPSHOT_FOLDER):
+        os.makedirs(SNAPSHOT_FOLDER)
+
+    with open(get_snapshotFullPath(doc), 'w') as outFile:
+        json.dump(snapshot, outFile)
+
+# ===================================================================
+def get_changedInterval(oldKeys, newKeys, rangeFrom, rangeTo):
+# ===================================================================
+    # Works out the frame interval of a track whose keys have changed.
+    # A changed key affects the frames between its neighbouring keys, taken
+    # from both versions of the track, and a changed first or last key
+    # affects everything up to the start or end of the document range
+    # .....................................................................
+    oldStates = {key[0]: key for key in oldKeys}
+    newStates = {key[0]: key for key in newKeys}
+    keyFrames = sorted(set(oldStates) | set(newStates))
+
+    changedFrom = changedTo = None
+    for idx, frame in enumerate(keyFrames):
+        if oldStates.get(frame) == newStates.get(frame):
+            continue
+
+        lower = keyFrames[idx - 1] if 0 < idx else rangeFrom
+        upper = keyFrames[idx + 1] if idx + 1 < len(keyFrames) else rangeTo
+        changedFrom = lower if changedFrom is None else min(changedFrom, lower)
+        changedTo = upper if changedTo is None else max(changedTo, upper)
+
+    if changedFrom is None:
+        return None
+
+    # Only the frames within the document range are of interest
+    changedFrom = max(changedFrom, rangeFrom)
+    changedTo = min(changedTo, rangeTo)
+    if changedTo < changedFrom:
+        return None
+
+    return [changedFrom, changedTo]
+
+# ===================================================================
+def diff_snapshots(oldSnapshot, newSnapshot, rangeFrom, rangeTo):
+# ===================================================================
+    # Compares two snapshots and returns the array of frame ranges
+    # in which the animated state differs
+    # ............................................................
+    rangeArray = []
+    for trackKey in set(oldSnapshot) | set(newSnapshot):
+        oldEntry = oldSnapshot.get(trackKey)
+        newEntry = newSnapshot.get(trackKey)
+        if oldEntry is not None and newEntry is not None and oldEntry[SNAP_DIGEST] == newEntry[SNAP_DIGEST]:
+            continue
+
+        interval = get_changedInterval(
+            oldEntry[SNAP_KEYS] if oldEntry is not None else [],
+            newEntry[SNAP_KEYS] if newEntry is not None else [],
+            rangeFrom, rangeTo)
+        if interval is not None:
+            if True == debug:
+                print("Track changed: " + trackKey + " frames " + str(interval))
+            rangeArray.append(interval)
+
+    return rangeArray
+
+# ===================================================================
+def calc_changed_frame_ranges(doc=None):
+# ===================================================================
+    # Compares the document with the snapshot taken at the last submission
+    # and returns the normalised string and array of the frames which have
+    # changed, or None if no snapshot has yet been taken
+    # ....................................................................
+    if doc is None:
+        doc = documents.GetActiveDocument()
+
+    oldSnapshot = load_snapshot(doc)
+    if oldSnapshot is None:
+        return None
+
+    renderSettings = rb_functions.get_render_settings(doc)
+    rangeArray = diff_snapshots(
+        oldSnapshot,
+        snapshot_tracks(doc),
+        renderSettings[rb_functions.RANGE_FROM],
+        renderSettings[rb_functions.RANGE_TO])
+
+    return rb_functions.normalise_frame_ranges(rangeArray)
+
+# ===================================================================
+def record_snapshot(doc=None):
+# ===================================================================
+    # Takes a snapshot of the document animation and saves it as the
+    # baseline for the next comparison
+    # ...............................................................
+    if doc is None:
+        doc = documents.GetActiveDocument()
+
+    save_snapshot(doc, snapshot_tracks(doc))
+    if True == debug:
+        print("Animation snapshot recorded for " + doc.GetDocumentName())
@@ -0,0 +1,164 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+
+Description:
+    Audits the output folders of every Cinema 4D project in a directory tree
+    and writes one report of the missing and stale frames of each project.
+    It runs headless under the Cinema 4D Python interpreter, for example:
+
+        c4dpy rb_batch_audit.py /shows/shots /tmp/audit.json --workers 8
+
+    The report is written as CSV when the report file ends in '.csv'.
+"""
+
+import os, sys, csv, json, time, argparse
+import concurrent.futures
+import c4d
+from c4d import documents
+import rb_functions, rb_scan_output
+
+config = rb_functions.get_config_values()
+debug = bool(int(config.get(rb_functions.CONFIG_SECTION, 'debug')))
+verbose = bool(int(config.get(rb_functions.CONFIG_SECTION, 'verbose')))
+
+REPORT_FIELDS = [
+    'project', 'savePath', 'filePrefix', 'frameRange', 'filesScanned', 'framesFound',
+    'missingCount', 'missing', 'staleCount', 'stale', 'error'
+]
+
+# ===================================================================
+def find_projects(rootPath):
+# ===================================================================
+    # Returns the sorted list of project files found in the directory tree
+    # ....................................................................
+    projects = []
+    for dirPath, dirNames, fileNames in os.walk(rootPath):
+        for fileName in fileNames:
+            if fileName.lower().endswith('.c4d'):
+                projects.append(os.path.join(dirPath, fileName))
+
+    return sorted(projects)
+
+# ===================================================================
+def resolve_project_output(projectFullPath):
+# ===================================================================
+    # Loads a project and works out its output folder, file prefix and the
+    # window of frames to audit, resolving the tokens of the save path
+    # exactly as the dialog does.  The Cinema 4D API is not thread safe,
+    # so this runs in the main process
+    # ......................................................................
+    doc = documents.LoadDocument(projectFullPath, c4d.SCENEFILTER_OBJECTS, None)
+    if doc is None:
+        raise RuntimeError("Failed to load the project")
+
+    try:
+        savePath = rb_functions.get_ResultsOutputDirectory(doc)
+        if False == savePath:
+            raise RuntimeError("No save path has been specified in project settings")
+
+        savePath, filePrefix = rb_functions.split_output_path(savePath, doc.GetDocumentName())
+        # A relative save path is relative to the project folder
+        if False == os.path.isabs(savePath):
+            savePath = os.path.normpath(os.path.join(doc.GetDocumentPath(), savePath))
+
+        window = rb_scan_output.get_gap_window(rb_functions.get_render_settings(doc))
+
+    finally:
+        documents.KillDocument(doc)
+
+    return savePath, filePrefix, window
+
+# ===================================================================
+def audit_output_folder(projectFullPath, savePath, filePrefix, window):
+# ===================================================================
+    # Scans one output folder and returns its report record.  This runs in
+    # a worker process, so it only touches the file system.  Only images in
+    # the window of frames are audited and those older than the project
+    # file are reported as stale
+    # ......................................................................
+    record = {'project': projectFullPath, 'savePath': savePath, 'filePrefix': filePrefix, 'frameRange': str(window[0]) + '-' + str(window[1])}
+    scanResult = rb_scan_output.scan_output_folder(savePath, filePrefix, os.path.getmtime(projectFullPath), window=window)
+    missingRangeArray = rb_scan_output.calc_missing_ranges(scanResult)
+    staleRangeArray = rb_functions.frames_to_ranges(scanResult.staleFrames)
+
+    record['filesScanned'] = scanResult.filesScanned
+    record['framesFound'] = len(scanResult.frames)
+    record['missingCount'] = rb_functions.count_frames(missingRangeArray)
+    record['missing'] = rb_functions.format_frame_ranges(rb_functions.compress_frame_ranges(missingRangeArray))
+    record['staleCount'] = len(scanResult.staleFrames)
+    record['stale'] = rb_functions.format_frame_ranges(rb_functions.compress_frame_ranges(staleRangeArray))
+
+    return record
+
+# ===================================================================
+def audit_projects(rootPath, workers=None):
+# ===================================================================
+    # Audits every project in the directory tree.  Projects are loaded one
+    # at a time in this process and each output folder is handed to the
+    # process pool as soon as it is known, so scanning overlaps loading
+    # ....................................................................
+    records = []
+    futures = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for projectFullPath in find_projects(rootPath):
+            if True == verbose:
+                print("Resolving output of " + projectFullPath)
+            try:
+                savePath, filePrefix, window = resolve_project_output(projectFullPath)
+            except Exception as e:
+                records.append({'project': projectFullPath, 'error': str(e)})
+                continue
+
+            future = executor.submit(audit_output_folder, projectFullPath, savePath, filePrefix, window)
+            futures[future] = (projectFullPath, savePath, filePrefix)
+
+        for future in concurrent.futures.as_completed(futures):
+            projectFullPath, savePath, filePrefix = futures[future]
+            try:
+                records.append(future.result())
+            except Exception as e:
+                records.append({'project': projectFullPath, 'savePath': savePath, 'filePrefix': filePrefix, 'error': str(e)})
+
+    records.sort(key=lambda record: record['project'])
+
+    return records
+
+# ===================================================================
+def write_report(records, reportFullPath):
+# ===================================================================
+    # Writes the report as CSV if the file name ends in '.csv', else as JSON
+    # ......................................................................
+    if reportFullPath.lower().endswith('.csv'):
+        with open(reportFullPath, 'w', newline='') as reportFile:
+            writer = csv.DictWriter(reportFile, fieldnames=REPORT_FIELDS, restval='')
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        with open(reportFullPath, 'w') as reportFile:
+            json.dump({'generated': time.time(), 'projects': records}, reportFile, indent=2)
+
+# ===================================================================
+def main(argv):
+# ===================================================================
+    parser = argparse.ArgumentParser(description="Power Ranger output audit of a tree of Cinema 4D projects")
+    parser.add_argument('root', help="folder to search for .c4d projects")
+    parser.add_argument('report', help="report file, .json or .csv")
+    parser.add_argument('--workers', type=int, default=None, help="number of scanning processes, defaults to the number of cores")
+    args = parser.parse_args(argv)
+
+    startTime = time.time()
+    records = audit_projects(args.root, args.workers)
+    write_report(records, args.report)
+
+    print("Audited " + str(len(records)) + " projects in " + str(round(time.time() - startTime, 2)) + " seconds")
+    print("Report written to " + args.report)
+
+    return 0
+
+# ===================================================================
+# main entry function
+# ===================================================================
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
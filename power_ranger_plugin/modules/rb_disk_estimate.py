@@ -0,0 +1,149 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+
+Description:
+    Estimates the size of the images a submission will write, from the
+    sizes of the nearest frames already rendered, and compares it with the
+    free space of the output volume before any render starts.
+"""
+
+import os, bisect, shutil
+import rb_functions
+
+config = rb_functions.get_config_values()
+debug = bool(int(config.get(rb_functions.CONFIG_SECTION, 'debug')))
+verbose = bool(int(config.get(rb_functions.CONFIG_SECTION, 'verbose')))
+
+# Number of rendered frames either side of a frame used for its estimate
+NEIGHBOUR_FRAMES = 2
+
+BYTE_UNITS = ['bytes', 'KB', 'MB', 'GB', 'TB']
+
+# ===================================================================
+class OutputEstimate(object):
+# ===================================================================
+    """
+    The projected output of the frames to be rendered into one folder
+        passBytes: dictionary of pass name to its estimated bytes
+        netBytes: the extra space needed, allowing for images overwritten
+        framesUnknown: frames of passes which have no rendered images to go by
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.passBytes = {}
+        self.netBytes = 0
+        self.framesUnknown = 0
+
+    # ===================================================================
+    def getTotalBytes(self):
+    # ===================================================================
+        return sum(self.passBytes.values())
+
+# ===================================================================
+def format_bytes(byteCount):
+# ===================================================================
+    # Returns the byte count in the largest sensible unit, e.g. 1.5 GB
+    # ................................................................
+    size = float(byteCount)
+    for unit in BYTE_UNITS:
+        if 1024 > abs(size) or unit == BYTE_UNITS[-1]:
+            break
+        size /= 1024
+
+    return str(int(size)) + ' ' + unit if 'bytes' == unit else str(round(size, 1)) + ' ' + unit
+
+# ===================================================================
+def estimate_output_bytes(scanResult, rangeArray, folder):
+# ===================================================================
+    # Estimates the bytes each pass will write for the frames of the array
+    # of rangelets.  A frame is estimated as the mean size of the nearest
+    # rendered frames either side of it, ignoring empty images.  A frame
+    # which is already rendered will be overwritten, so its current size
+    # is taken off the space needed
+    # .....................................................................
+    estimate = OutputEstimate(folder)
+    frames = []
+    for elem in rangeArray:
+        step = int(elem[2]) if True == rb_functions.isSteppedRangelet(elem) else 1
+        frames.extend(range(int(elem[0]), int(elem[1]) + 1, step))
+
+    for passName, passFrames in scanResult.passFrames.items():
+        renderedFrames = sorted(frame for frame, details in passFrames.items() if 0 < details[1])
+        if 0 >= len(renderedFrames):
+            estimate.framesUnknown += len(frames)
+            continue
+
+        passBytes = 0
+        for frame in frames:
+            idx = bisect.bisect_left(renderedFrames, frame)
+            neighbours = renderedFrames[max(0, idx - NEIGHBOUR_FRAMES): idx + NEIGHBOUR_FRAMES]
+            frameBytes = sum(passFrames[neighbour][1] for neighbour in neighbours) // len(neighbours)
+            passBytes += frameBytes
+            estimate.netBytes += frameBytes - passFrames.get(frame, (0, 0))[1]
+
+        estimate.passBytes[passName] = passBytes
+
+    if True == verbose:
+        print("Estimated output in " + str(folder) + ": " + format_bytes(estimate.getTotalBytes()))
+
+    return estimate
+
+# ===================================================================
+def get_existing_folder(folder):
+# ===================================================================
+    # The output folder may not yet exist, so returns the nearest one that does
+    # .........................................................................
+    folder = os.path.abspath(folder)
+    while False == os.path.isdir(folder) and os.path.dirname(folder) != folder:
+        folder = os.path.dirname(folder)
+
+    return folder
+
+# ===================================================================
+def check_free_space(estimates):
+# ===================================================================
+    # Adds up the space needed on each output volume and returns a list of
+    # (folder, bytes needed, bytes free), one per volume
+    # ....................................................................
+    volumes = {}
+    for estimate in estimates:
+        folder = get_existing_folder(estimate.folder)
+        device = os.stat(folder).st_dev
+        if device not in volumes:
+            volumes[device] = [folder, 0, shutil.disk_usage(folder).free]
+        volumes[device][1] += max(0, estimate.netBytes)
+
+    return [tuple(volume) for volume in volumes.values()]
+
+# ===================================================================
+def describe_estimates(estimates):
+# ===================================================================
+    # Returns the text for the confirmation dialog: the projected volume,
+    # broken down by pass, and the free space of each output volume with
+    # any shortfall.  Also returns whether there is enough space
+    # ....................................................................
+    passBytes = {}
+    framesUnknown = 0
+    for estimate in estimates:
+        framesUnknown += estimate.framesUnknown
+        for passName, byteCount in estimate.passBytes.items():
+            passBytes[passName] = passBytes.get(passName, 0) + byteCount
+
+    lines = ["Estimated output: " + format_bytes(sum(passBytes.values()))]
+    if 1 < len(passBytes):
+        for passName, byteCount in sorted(passBytes.items()):
+            lines.append("    " + ('image' if '' == passName else passName) + ": " + format_bytes(byteCount))
+    if 0 < framesUnknown:
+        lines.append("    not including " + str(framesUnknown) + " frames with no rendered images to go by")
+
+    enoughSpace = True
+    for folder, bytesNeeded, bytesFree in check_free_space(estimates):
+        lines.append("Free space on " + folder + ": " + format_bytes(bytesFree))
+        if bytesNeeded > bytesFree:
+            enoughSpace = False
+            lines.append("WARNING: the output volume is short by " + format_bytes(bytesNeeded - bytesFree))
+
+    return '\n'.join(lines), enoughSpace
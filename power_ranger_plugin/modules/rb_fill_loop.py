@@ -0,0 +1,173 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+
+Description:
+    Fills the gaps until they are all rendered.  The missing frames are
+    submitted, and once the render has finished only the frames just
+    submitted are checked again.  Any still missing, empty or not written
+    since the submission are submitted again, up to 'fillRetries' times.
+    The dialog timer drives the loop, so the session stays responsive.
+"""
+
+import time
+from c4d import documents
+import rb_functions, rb_handle_render_ranges, rb_path_predict
+
+config = rb_functions.get_config_values()
+debug = bool(int(config.get(rb_functions.CONFIG_SECTION, 'debug')))
+verbose = bool(int(config.get(rb_functions.CONFIG_SECTION, 'verbose')))
+
+DEFAULT_FILL_RETRIES = 3
+# Some file systems keep modified times to the nearest two seconds
+MTIME_TOLERANCE = 2.0
+
+# ===================================================================
+def get_fill_retries():
+# ===================================================================
+    # Returns the number of times frames which failed are submitted again
+    # ...................................................................
+    retriesStr = rb_functions.get_config_values().get(rb_functions.CONFIG_RANGER_SECTION, 'fillRetries', fallback='').strip()
+    if '' == retriesStr:
+        return DEFAULT_FILL_RETRIES
+    if False == retriesStr.isnumeric():
+        print("WARNING: ignoring fill retries '" + retriesStr + "', expected a number")
+        return DEFAULT_FILL_RETRIES
+
+    return int(retriesStr)
+
+# ===================================================================
+def rescan_submitted_frames(sourceTake, sourceRenderData, rangeArray, submitTime, doc=None):
+# ===================================================================
+    # Checks the images of the frames of a job, and no others.  Where the
+    # image format is known each image is looked up by name, otherwise the
+    # output folders are listed.  Images written before the submission
+    # count as stale.  Uses the Cinema 4D API to predict the image names,
+    # so must run on the main thread
+    # .....................................................................
+    if doc is None:
+        doc = documents.GetActiveDocument()
+    renderData = sourceRenderData if sourceRenderData is not None else doc.GetActiveRenderData()
+    take = rb_functions.get_job_take(doc, sourceTake)
+
+    frames = []
+    for elem in rangeArray:
+        step = int(elem[2]) if True == rb_functions.isSteppedRangelet(elem) else 1
+        frames.extend(range(int(elem[0]), int(elem[1]) + 1, step))
+    frames = sorted(set(frames))
+
+    expectedFiles, hasExtension = rb_path_predict.build_expected_files(doc, renderData, frames, take)
+    passExtensions = rb_path_predict.get_pass_extensions(renderData) if True == hasExtension else {}
+    if passExtensions is None:
+        return rb_path_predict.match_expected_files(expectedFiles, hasExtension, frames, submitTime)
+
+    return rb_path_predict.stat_expected_files(expectedFiles, passExtensions, frames, submitTime)
+
+# ===================================================================
+class FillLoop(object):
+# ===================================================================
+    """
+    Submits the (source take, render data, array of rangelets) jobs until
+    every frame has rendered or the retries run out.  Each iteration is
+    summarised as a dictionary of its counts
+    """
+
+    def __init__(self, takeJobs, maxRetries=None, usePool=False):
+        self.takeJobs = takeJobs
+        self.maxRetries = get_fill_retries() if maxRetries is None else maxRetries
+        self.usePool = usePool
+        self.iterations = []
+        self.submitTime = None
+        self.renderPool = None
+        self.cancelled = False
+        self.finished = False
+
+    # ===================================================================
+    def submit(self):
+    # ===================================================================
+        # Submits the jobs of the next iteration.  Returns False on error
+        self.submitTime = time.time()
+        self.iterations.append({
+            'iteration': len(self.iterations) + 1,
+            'framesSubmitted': sum(rb_functions.count_frames(rangeArray) for take, renderData, rangeArray in self.takeJobs)
+        })
+        print("Fill loop iteration " + str(len(self.iterations)) + ": submitting " + str(self.iterations[-1]['framesSubmitted']) + " frames")
+
+        if True == self.usePool:
+            self.renderPool = rb_handle_render_ranges.handle_render_pool_jobs(self.takeJobs)
+            submitted = self.renderPool is not None
+        else:
+            submitted = rb_handle_render_ranges.handle_render_take_jobs(self.takeJobs)
+
+        if False == submitted:
+            self.finished = True
+
+        return submitted
+
+    # ===================================================================
+    def isRenderFinished(self):
+    # ===================================================================
+        if self.renderPool is not None:
+            return self.renderPool.isFinished()
+
+        # Rendering to the Picture Viewer carries on after the command returns
+        return rb_handle_render_ranges.poll_picture_viewer_render()
+
+    # ===================================================================
+    def rescan(self):
+    # ===================================================================
+        # Checks the frames just submitted and works out the jobs of the
+        # next iteration, from the frames which are still not rendered
+        if self.renderPool is not None:
+            rb_handle_render_ranges.finish_render_pool(self.renderPool)
+            self.renderPool = None
+
+        summary = self.iterations[-1]
+        summary['seconds'] = round(time.time() - self.submitTime, 1)
+        summary['framesRendered'] = summary['framesMissing'] = summary['framesCorrupt'] = 0
+        retryJobs = []
+        for sourceTake, sourceRenderData, rangeArray in self.takeJobs:
+            scanResult = rescan_submitted_frames(sourceTake, sourceRenderData, rangeArray, self.submitTime - MTIME_TOLERANCE)
+            failedFrames = sorted(set(scanResult.missingFrames + scanResult.staleFrames + scanResult.corruptFrames))
+            summary['framesRendered'] += len(scanResult.expectedFrames) - len(failedFrames)
+            summary['framesMissing'] += len(scanResult.missingFrames) + len(scanResult.staleFrames)
+            summary['framesCorrupt'] += len(scanResult.corruptFrames)
+            if 0 < len(failedFrames):
+                _, retryArray = rb_functions.normalise_frame_ranges(rb_functions.compress_frame_ranges(rb_functions.frames_to_ranges(failedFrames)))
+                retryJobs.append((sourceTake, sourceRenderData, retryArray))
+
+        if True == debug:
+            print("Fill loop iteration " + str(summary['iteration']) + ": " + str(summary))
+
+        self.takeJobs = retryJobs
+        if 0 >= len(retryJobs) or len(self.iterations) > self.maxRetries or True == self.cancelled:
+            self.finished = True
+
+    # ===================================================================
+    def cancel(self):
+    # ===================================================================
+        # Stops the loop after the render in progress
+        self.cancelled = True
+        if self.renderPool is not None:
+            self.renderPool.cancel()
+
+    # ===================================================================
+    def isComplete(self):
+    # ===================================================================
+        # True once every frame has rendered
+        return True == self.finished and 0 >= len(self.takeJobs)
+
+    # ===================================================================
+    def getSummary(self):
+    # ===================================================================
+        # Returns a line of text for each iteration
+        lines = []
+        for summary in self.iterations:
+            line = "Pass " + str(summary['iteration']) + ": " + str(summary['framesSubmitted']) + " frames submitted"
+            if 'seconds' in summary:
+                line += (", " + str(summary['framesRendered']) + " rendered, " + str(summary['framesMissing']) + " missing, " +
+                         str(summary['framesCorrupt']) + " corrupt in " + str(summary['seconds']) + " seconds")
+            lines.append(line)
+
+        return '\n'.join(lines)
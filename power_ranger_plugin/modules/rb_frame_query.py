@@ -0,0 +1,323 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+
+Description:
+    Evaluates frame range expressions, combining literal rangelets and the
+    named sets produced by the output scan with set operations, e.g.
+
+        docrange - rendered + corrupt
+        (missing + stale) & 100-200
+
+    Operators are '+' or ',' for union, '-' for difference and '&' for
+    intersection, which binds more tightly.  Within an expression a range
+    is written without spaces, so that '10-15' is a range and '10 - 15' is
+    a difference.  The sets are held as arrays of [from, to] intervals,
+    along with any [from, to, step] progressions, so the cost follows the
+    number of intervals rather than frames.
+"""
+
+import re, bisect
+import rb_functions
+
+config = rb_functions.get_config_values()
+debug = bool(int(config.get(rb_functions.CONFIG_SECTION, 'debug')))
+verbose = bool(int(config.get(rb_functions.CONFIG_SECTION, 'verbose')))
+
+# Named sets understood in expressions
+SET_MISSING = 'missing'
+SET_STALE = 'stale'
+SET_CORRUPT = 'corrupt'
+SET_RENDERED = 'rendered'
+SET_DOCRANGE = 'docrange'
+
+QUERY_TOKEN = re.compile(r'\s*(?:(?P<name>[A-Za-z_]+)|(?P<literal>-?\d+(?:--?\d+)?(?::\d+)?)|(?P<op>[-+,&()]))')
+
+# ===================================================================
+def is_frame_query(text):
+# ===================================================================
+    # Plain lists of rangelets keep to the original syntax, anything with
+    # a set name, an intersection or brackets is an expression
+    # ....................................................................
+    return None is not re.search(r'[A-Za-z&()]', text)
+
+# ===================================================================
+def union_intervals(left, right):
+# ===================================================================
+    outArray = []
+    for elem in sorted(left + right):
+        if 0 < len(outArray) and elem[0] <= outArray[-1][1] + 1:
+            outArray[-1][1] = max(outArray[-1][1], elem[1])
+        else:
+            outArray.append([elem[0], elem[1]])
+
+    return outArray
+
+# ===================================================================
+def intersect_intervals(left, right):
+# ===================================================================
+    outArray = []
+    leftIdx = rightIdx = 0
+    while leftIdx < len(left) and rightIdx < len(right):
+        lower = max(left[leftIdx][0], right[rightIdx][0])
+        upper = min(left[leftIdx][1], right[rightIdx][1])
+        if lower <= upper:
+            outArray.append([lower, upper])
+        # Move on from whichever interval finishes first
+        if left[leftIdx][1] < right[rightIdx][1]:
+            leftIdx += 1
+        else:
+            rightIdx += 1
+
+    return outArray
+
+# ===================================================================
+def subtract_intervals(left, right):
+# ===================================================================
+    outArray = []
+    rightIdx = 0
+    for elem in left:
+        lower, upper = elem
+        # Skip the intervals which finish before this one starts
+        while rightIdx < len(right) and right[rightIdx][1] < lower:
+            rightIdx += 1
+        idx = rightIdx
+        while idx < len(right) and right[idx][0] <= upper:
+            if right[idx][0] > lower:
+                outArray.append([lower, right[idx][0] - 1])
+            lower = max(lower, right[idx][1] + 1)
+            idx += 1
+        if lower <= upper:
+            outArray.append([lower, upper])
+
+    return outArray
+
+# ===================================================================
+def to_frame_set(rangeArray):
+# ===================================================================
+    # Converts an array of rangelets to a frame set: a tuple of sorted,
+    # disjoint [from, to] intervals and a list of [from, to, step]
+    # progressions which share no frames with them or each other
+    # ..................................................................
+    frameSet = (union_intervals([[int(elem[0]), int(elem[1])] for elem in rangeArray
+                                 if False == rb_functions.isSteppedRangelet(elem)], []), [])
+    for elem in rangeArray:
+        if True == rb_functions.isSteppedRangelet(elem):
+            frameSet = union_frame_sets(frameSet, ([], [[int(elem[0]), int(elem[1]), int(elem[2])]]))
+
+    return frameSet
+
+# ===================================================================
+def from_pieces(intervals, pieces):
+# ===================================================================
+    # Builds a frame set from intervals and pieces of progressions, where
+    # a piece of one frame, or with a step of one, joins the intervals
+    # ..................................................................
+    plainPieces = [[elem[0], elem[1]] for elem in pieces if False == rb_functions.isSteppedRangelet(elem)]
+    progressions = [elem for elem in pieces if True == rb_functions.isSteppedRangelet(elem)]
+    if 0 < len(plainPieces):
+        intervals = union_intervals(intervals, plainPieces)
+
+    return intervals, progressions
+
+# ===================================================================
+def overlapping_intervals(intervals, lower, upper):
+# ===================================================================
+    # The sorted, disjoint intervals which have frames from lower to upper
+    # .....................................................................
+    idx = bisect.bisect_left(intervals, [lower, lower]) - 1
+    idx = max(0, idx)
+    while idx < len(intervals) and intervals[idx][0] <= upper:
+        if intervals[idx][1] >= lower:
+            yield intervals[idx]
+        idx += 1
+
+# ===================================================================
+def subtract_from_pieces(pieces, frameSet):
+# ===================================================================
+    # Takes the frames of a frame set out of pieces of progressions
+    # .............................................................
+    intervals, progressions = frameSet
+    outPieces = []
+    for piece in pieces:
+        overlapping = list(overlapping_intervals(intervals, piece[0], piece[1]))
+        if True == rb_functions.isSteppedRangelet(piece):
+            outPieces += rb_functions.trim_stepped_rangelet(piece, overlapping)
+        else:
+            outPieces += subtract_intervals([piece], overlapping)
+    for progression in progressions:
+        outPieces = [remainder for piece in outPieces for remainder in rb_functions.subtract_progression(piece, progression)]
+
+    return outPieces
+
+# ===================================================================
+def union_frame_sets(left, right):
+# ===================================================================
+    intervals = union_intervals(left[0], right[0])
+    pieces = subtract_from_pieces(left[1], (right[0], []))
+    pieces += subtract_from_pieces(right[1], (left[0], left[1]))
+
+    return from_pieces(intervals, pieces)
+
+# ===================================================================
+def intersect_frame_sets(left, right):
+# ===================================================================
+    intervals = intersect_intervals(left[0], right[0])
+    pieces = []
+    for progressions, otherIntervals in [(left[1], right[0]), (right[1], left[0])]:
+        for progression in progressions:
+            for interval in overlapping_intervals(otherIntervals, progression[0], progression[1]):
+                pieces.append(rb_functions.clip_progression(progression, interval[0], interval[1]))
+    for leftProgression in left[1]:
+        for rightProgression in right[1]:
+            pieces.append(rb_functions.intersect_progressions(leftProgression, rightProgression))
+
+    return from_pieces(intervals, [piece for piece in pieces if piece is not None])
+
+# ===================================================================
+def subtract_frame_sets(left, right):
+# ===================================================================
+    intervals = subtract_intervals(left[0], right[0])
+    # Intervals the right progressions run through are split around their frames
+    touched = []
+    for progression in right[1]:
+        touched = union_intervals(touched, list(overlapping_intervals(intervals, progression[0], progression[1])))
+    if 0 < len(touched):
+        intervals = subtract_intervals(intervals, touched)
+    pieces = subtract_from_pieces(touched, ([], right[1])) + subtract_from_pieces(left[1], right)
+
+    return from_pieces(intervals, pieces)
+
+# ===================================================================
+def to_range_array(frameSet):
+# ===================================================================
+    # Converts a frame set back to an array of rangelets
+    # ..................................................
+    intervals, progressions = frameSet
+
+    return rb_functions.compress_frame_ranges(intervals) + progressions
+
+# ===================================================================
+def tokenise_query(text):
+# ===================================================================
+    # Splits the expression into (kind, value) tokens.  A minus sign is
+    # an operator after an operand and part of a literal otherwise
+    # .................................................................
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        expectOperand = 0 >= len(tokens) or tokens[-1][1] in ['+', ',', '-', '&', '(']
+        match = QUERY_TOKEN.match(text, pos)
+        if match is None:
+            raise ValueError("Unexpected character '" + text[pos:].strip()[:1] + "' in frame expression")
+
+        if match.group('literal') is not None and (expectOperand or False == match.group('literal').startswith('-')):
+            tokens.append(('literal', match.group('literal')))
+        elif match.group('name') is not None:
+            tokens.append(('name', match.group('name').lower()))
+        elif match.group('literal') is not None:
+            # A minus sign after an operand, take just the operator
+            tokens.append(('op', '-'))
+            pos = match.start('literal') + 1
+            continue
+        else:
+            tokens.append(('op', match.group('op')))
+        pos = match.end()
+
+    return tokens
+
+# ===================================================================
+class FrameQuery(object):
+# ===================================================================
+    """
+    Recursive descent evaluation of a tokenised frame expression
+        expression := term (('+' | ',' | '-') term)*
+        term := operand ('&' operand)*
+        operand := literal | name | '(' expression ')'
+    """
+
+    def __init__(self, tokens, namedSets):
+        self.tokens = tokens
+        self.pos = 0
+        self.namedSets = namedSets
+
+    # ===================================================================
+    def peek(self):
+    # ===================================================================
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    # ===================================================================
+    def evaluate(self):
+    # ===================================================================
+        result = self.expression()
+        if self.pos < len(self.tokens):
+            raise ValueError("Unexpected '" + self.tokens[self.pos][1] + "' in frame expression")
+        return result
+
+    # ===================================================================
+    def expression(self):
+    # ===================================================================
+        result = self.term()
+        while self.peek()[1] in ['+', ',', '-']:
+            operator = self.tokens[self.pos][1]
+            self.pos += 1
+            if '-' == operator:
+                result = subtract_frame_sets(result, self.term())
+            else:
+                result = union_frame_sets(result, self.term())
+        return result
+
+    # ===================================================================
+    def term(self):
+    # ===================================================================
+        result = self.operand()
+        while '&' == self.peek()[1]:
+            self.pos += 1
+            result = intersect_frame_sets(result, self.operand())
+        return result
+
+    # ===================================================================
+    def operand(self):
+    # ===================================================================
+        kind, value = self.peek()
+        self.pos += 1
+        if 'literal' == kind:
+            if False is rb_functions.stateTransitionRangelet(value):
+                raise ValueError("Invalid range '" + value + "' in frame expression")
+            _, rangeArray = rb_functions.analyse_frame_ranges(value)
+            return to_frame_set(rangeArray)
+
+        elif 'name' == kind:
+            if value not in self.namedSets:
+                raise ValueError("Unknown set '" + value + "', expected one of: " + ', '.join(sorted(self.namedSets)))
+            namedSet = self.namedSets[value]
+            # Sets may be supplied as functions, so they are only worked out when used
+            if callable(namedSet):
+                namedSet = namedSet()
+            return to_frame_set(namedSet)
+
+        elif '(' == value:
+            result = self.expression()
+            if ')' != self.peek()[1]:
+                raise ValueError("Missing ')' in frame expression")
+            self.pos += 1
+            return result
+
+        raise ValueError("Expected a range or set name in frame expression")
+
+# ===================================================================
+def evaluate_frame_query(text, namedSets):
+# ===================================================================
+    # Evaluates a frame expression and returns the normalised string and
+    # array of rangelets, as analyse_frame_ranges does.  The named sets
+    # map each name to an array of rangelets, or to a function returning
+    # one.  Raises ValueError if the expression cannot be evaluated
+    # ..................................................................
+    frameSet = FrameQuery(tokenise_query(text), namedSets).evaluate()
+    if True == debug:
+        print("Frame expression '" + text + "' resolved to " + str(len(frameSet[0])) + " intervals and " +
+              str(len(frameSet[1])) + " progressions")
+
+    return rb_functions.normalise_frame_ranges(to_range_array(frameSet))
@@ -4,7 +4,7 @@ Copyright:      PowerHouse Industries Nov 2023
 Author:         Brian Etheridge
 """
 
-import os, platform, c4d
+import os, math, platform, c4d
 from c4d import documents
 
 try:
@@ -30,6 +30,10 @@ ERROR = 'e'
 EXIT = 'x'
 END = '#'
 MASK_SIGN = 'm'
+STEP_SIGN = ':'
+
+# Fewest single frames at an even spacing worth writing as a stepped rangelet
+MIN_STEPPED_RUN = 3
 
 CONFIG_FILE = __root__ + '/config/properties.ini'
 
@@ -79,6 +83,7 @@ def analyse_frame_ranges(frameRangeStr):
     frameRangeLst = frameRangeStr.replace(' ', '').replace('+', '').split(',')
 
     # First of all, allow for negative numbers, although we cannot render negative frames
+    # A rangelet may carry a frame step, e.g. 10-40:3
     frameRangeVldLst = []
     for entry in frameRangeLst:
         res = stateTransitionRangelet(entry)
@@ -89,6 +94,8 @@ def analyse_frame_ranges(frameRangeStr):
     rangeArray = []
 
     for entry in frameRangeVldLst:
+        # Separate any frame step from the range
+        entry, _, stepStr = entry.partition(STEP_SIGN)
         # Range should be number-number
         rangelet = entry.split('-')
         if 1 == len(rangelet):
@@ -117,7 +124,10 @@ def analyse_frame_ranges(frameRangeStr):
             el = rangelet[0]
             rangelet[0] = rangelet[1]
             rangelet[1] = el
-            
+
+        if '' != stepStr:
+            rangelet = make_stepped_rangelet(int(rangelet[0]), int(rangelet[1]), int(stepStr))
+
         rangeArray.append(rangelet)
 
     return normalise_frame_ranges(rangeArray)
@@ -129,6 +139,224 @@ def sortNumeric(val):
     # a numeric comparison so that 7 is before 15 (ie '7' < '15')
     return int(val[0])
 
+# ===================================================================
+def isSteppedRangelet(rangelet):
+# ===================================================================
+    if 2 < len(rangelet) and 1 < int(rangelet[2]):
+        return True
+    return False
+
+# ===================================================================
+def make_stepped_rangelet(frameFrom, frameTo, step):
+# ===================================================================
+    # Builds a rangelet with a frame step, pulling the upper limit back
+    # onto the last frame actually rendered.  A step of one, or a range
+    # which only renders its first frame, is returned as a plain rangelet
+    # ...................................................................
+    if 1 >= step:
+        return [frameFrom, frameTo]
+
+    frameTo = frameFrom + ((frameTo - frameFrom) // step) * step
+    if frameTo == frameFrom:
+        return [frameFrom, frameTo]
+
+    return [frameFrom, frameTo, step]
+
+# ===================================================================
+def frames_to_ranges(frames):
+# ===================================================================
+    # Converts a sorted list of frame numbers to an array of rangelets
+    # ................................................................
+    rangeArray = []
+    for frame in frames:
+        if 0 < len(rangeArray) and frame == rangeArray[-1][1] + 1:
+            rangeArray[-1][1] = frame
+        elif 0 >= len(rangeArray) or frame > rangeArray[-1][1]:
+            rangeArray.append([frame, frame])
+
+    return rangeArray
+
+# ===================================================================
+def compress_frame_ranges(rangeArray):
+# ===================================================================
+    # Looks for runs of single frames at an even spacing in a sorted array
+    # of plain rangelets, e.g. a node which dropped every third frame, and
+    # replaces each run with one stepped rangelet, e.g. 2-500:3
+    # ....................................................................
+    outArray = []
+    idx = 0
+    count = len(rangeArray)
+    while idx < count:
+        elem = rangeArray[idx]
+        if elem[0] == elem[1] and idx + 1 < count and rangeArray[idx + 1][0] == rangeArray[idx + 1][1]:
+            step = int(rangeArray[idx + 1][0]) - int(elem[0])
+            last = idx + 1
+            while (last + 1 < count
+                   and rangeArray[last + 1][0] == rangeArray[last + 1][1]
+                   and int(rangeArray[last + 1][0]) - int(rangeArray[last][0]) == step):
+                last += 1
+
+            if 1 < step and MIN_STEPPED_RUN <= last - idx + 1:
+                outArray.append([int(elem[0]), int(rangeArray[last][0]), step])
+                idx = last + 1
+                continue
+
+        outArray.append(elem)
+        idx += 1
+
+    return outArray
+
+# ===================================================================
+def format_frame_ranges(rangeArray):
+# ===================================================================
+    # Show: 1,2,3-6,7,8-10,12-30:3, etc
+    # .................................
+    returnStr = sep = ''
+    for elem in rangeArray:
+        if elem[0] == elem[1]:
+            returnStr += sep + str(elem[0])
+        elif isSteppedRangelet(elem):
+            returnStr += sep + str(elem[0]) + '-' + str(elem[1]) + STEP_SIGN + str(elem[2])
+        else:
+            returnStr += sep + str(elem[0]) + '-' + str(elem[1])
+        sep = ','
+
+    return returnStr
+
+# ===================================================================
+def merge_plain_rangelets(rangeArray):
+# ===================================================================
+    # Combines a sorted array of plain rangelets which overlap or touch
+    # .................................................................
+    outArray = []
+    for elem in rangeArray:
+        outArrayLen = len(outArray)
+        if 0 >= outArrayLen:
+            outArray.append(elem)
+            continue
+
+        # If start of range is less than or equal to end of range plus 1
+        # E.g. 1-1, 2-6, combine them as 1-6
+        if int(elem[0]) <= int(outArray[outArrayLen - 1][1]) + 1:
+            if int(elem[1]) >= int(outArray[outArrayLen - 1][1]):
+                outArray[outArrayLen - 1][1] = elem[1]
+            # We have adjusted the out array and do not need the element
+            continue
+
+        # Just add this new rangelet to out array
+        outArray.append(elem)
+
+    return outArray
+
+# ===================================================================
+def isOnSteppedRangelet(frame, rangelet):
+# ===================================================================
+    return (int(rangelet[0]) <= frame <= int(rangelet[1])
+            and 0 == (frame - int(rangelet[0])) % int(rangelet[2]))
+
+# ===================================================================
+def trim_stepped_rangelet(rangelet, plainArray):
+# ===================================================================
+    # Returns the pieces of a stepped rangelet which fall between the
+    # sorted plain rangelets, so that no frame is rendered twice.  A
+    # piece of one frame comes back as a plain rangelet
+    # ...............................................................
+    frameFrom, frameTo, step = int(rangelet[0]), int(rangelet[1]), int(rangelet[2])
+    pieces = []
+    frame = frameFrom
+    for elem in plainArray:
+        if int(elem[1]) < frame:
+            continue
+        if int(elem[0]) > frameTo:
+            break
+        if frame < int(elem[0]):
+            pieces.append(make_stepped_rangelet(frame, int(elem[0]) - 1, step))
+        # Next frame of the step after the plain rangelet
+        frame = frameFrom + ((int(elem[1]) - frameFrom) // step + 1) * step
+
+    if frame <= frameTo:
+        pieces.append(make_stepped_rangelet(frame, frameTo, step))
+
+    return pieces
+
+# ===================================================================
+def clip_progression(progression, lower, upper, step=None):
+# ===================================================================
+    # Returns the frames of the progression from lower to upper as a
+    # rangelet, or None if there are none.  A larger step, a multiple
+    # of the progression's, may be given to take every so many frames
+    # ...............................................................
+    frameFrom, frameTo, progressionStep = progression[0], progression[1], progression[2] if 2 < len(progression) else 1
+    if step is None:
+        step = progressionStep
+    lower = max(lower, frameFrom)
+    upper = min(upper, frameTo)
+    # First frame of the progression at or above the lower limit
+    first = frameFrom + -(-(lower - frameFrom) // progressionStep) * progressionStep
+    if first > upper:
+        return None
+
+    return make_stepped_rangelet(first, upper, step)
+
+# ===================================================================
+def intersect_progressions(left, right):
+# ===================================================================
+    # Returns the frames common to two progressions, which are themselves
+    # a progression with the lowest common multiple of their steps, or
+    # None.  An interval counts as a progression with a step of one
+    # ....................................................................
+    leftStep = left[2] if 2 < len(left) else 1
+    rightStep = right[2] if 2 < len(right) else 1
+    divisor = math.gcd(leftStep, rightStep)
+    if 0 != (right[0] - left[0]) % divisor:
+        return None
+
+    # Solve frame = left from (mod left step) = right from (mod right step)
+    modulus = rightStep // divisor
+    multiple = ((right[0] - left[0]) // divisor * pow(leftStep // divisor, -1, modulus)) % modulus if 1 < modulus else 0
+    step = leftStep * modulus
+    frame = left[0] + leftStep * multiple
+    lower = max(left[0], right[0])
+    upper = min(left[1], right[1])
+    first = frame + -(-(lower - frame) // step) * step
+    if first > upper:
+        return None
+
+    return make_stepped_rangelet(first, upper, step)
+
+# ===================================================================
+def subtract_progression(left, right):
+# ===================================================================
+    # Returns the pieces of the left progression, or interval, which are
+    # not in the right one.  Between the first and last common frames what
+    # is left is either one progression per offset or one piece per gap,
+    # whichever takes fewer pieces
+    # ....................................................................
+    common = intersect_progressions(left, right)
+    if common is None:
+        return [left]
+
+    leftStep = left[2] if 2 < len(left) else 1
+    commonStep = common[2] if 2 < len(common) else leftStep
+    offsets = commonStep // leftStep - 1
+    gaps = (common[1] - common[0]) // commonStep
+    if offsets < gaps:
+        # Each offset also takes in the frames before the first and after the last common frame
+        headFrom = max(left[0], common[0] - commonStep + leftStep)
+        tailTo = min(left[1], common[1] + commonStep - leftStep)
+        pieces = [clip_progression(left, left[0], headFrom - 1), clip_progression(left, tailTo + 1, left[1])]
+        for offset in range(1, offsets + 1):
+            offsetFrom = common[0] + offset * leftStep - commonStep
+            if offsetFrom < headFrom:
+                offsetFrom += commonStep
+            pieces.append(clip_progression(left, offsetFrom, tailTo, commonStep))
+    else:
+        pieces = [clip_progression(left, left[0], common[0] - 1), clip_progression(left, common[1] + 1, left[1])]
+        pieces += [clip_progression(left, frame + leftStep, frame + commonStep - leftStep)
+                   for frame in range(common[0], common[1], commonStep)]
+
+    return [piece for piece in pieces if piece is not None]
+
 # ===================================================================
 def normalise_frame_ranges(rangeArray):
 # ===================================================================
@@ -142,34 +370,115 @@ def normalise_frame_ranges(rangeArray):
     else:
         # Do a numeric sort into ascending order
         rangeArray.sort(key=sortNumeric)
-        for elem in rangeArray:
-            outArrayLen = len(outArray)
-            if 0 >= outArrayLen:
-                outArray.append(elem)
-                continue
+        # Stepped rangelets cannot be combined with their neighbours
+        steppedArray = [elem for elem in rangeArray if isSteppedRangelet(elem)]
+        # A single frame which a stepped rangelet renders anyway is not needed
+        plainArray = [elem for elem in rangeArray if False == isSteppedRangelet(elem)
+                      and not (elem[0] == elem[1] and any(isOnSteppedRangelet(int(elem[0]), stepped) for stepped in steppedArray))]
+        outArray = merge_plain_rangelets(plainArray)
+
+        if 0 < len(steppedArray):
+            # Take the frames the plain rangelets render out of the stepped ones
+            trimmedArray = []
+            for elem in steppedArray:
+                trimmedArray += trim_stepped_rangelet(elem, outArray)
+
+            # Take the frames an earlier stepped rangelet renders out of the later ones
+            keptArray = []
+            for elem in trimmedArray:
+                pieces = [elem]
+                for kept in keptArray:
+                    pieces = [remainder for piece in pieces for remainder in subtract_progression(piece, kept)]
+                keptArray += pieces
+
+            steppedArray = [elem for elem in keptArray if isSteppedRangelet(elem)]
+            singleArray = [elem for elem in keptArray if False == isSteppedRangelet(elem)]
+            if 0 < len(singleArray):
+                outArray = merge_plain_rangelets(sorted(outArray + singleArray, key=sortNumeric))
+            outArray = sorted(outArray + steppedArray, key=sortNumeric)
 
-            # If start of range is less than or equal to end of range plus 1
-            # E.g. 1-1, 2-6, combine them as 1-6
-            if int(elem[0]) <= int(outArray[outArrayLen - 1][1]) + 1:
-                if int(elem[1]) >= int(outArray[outArrayLen - 1][1]):
-                    outArray[outArrayLen - 1][1] = elem[1]
-                # We have adjusted the out array and do not need the element
-                continue
+    # Return both the string and array versions of the normalise data
+    return format_frame_ranges(outArray), outArray
+
+# ===================================================================
+def optimise_take_budget(rangeArray, maxTakes=0, maxOverhead=0):
+# ===================================================================
+    # Each rangelet becomes its own take, and each take costs a scene rebuild
+    # and cache warm up, so scattered rangelets are merged by rendering the
+    # frames between them.  The gaps are bridged cheapest first, which keeps
+    # the extra frames rendered to the minimum: enough of them to bring the
+    # takes down to maxTakes, then more while the extra frames stay within
+    # maxOverhead.  A maxTakes of zero means no limit on the takes and a
+    # maxOverhead of zero no merging beyond that.  Stepped rangelets are kept
+    # as they are, though they count towards the takes, and their frames in
+    # a gap are not extra.  If even one take for all the plain rangelets is
+    # over budget, only the overhead allows merging.  The array must be
+    # normalised.  Returns the array and the number of extra frames
+    # ........................................................................
+    plainArray = [[int(elem[0]), int(elem[1])] for elem in rangeArray if False == isSteppedRangelet(elem)]
+    steppedArray = [elem for elem in rangeArray if True == isSteppedRangelet(elem)]
+
+    # Extra frames of bridging each plain rangelet to the next, which are
+    # the frames between them less those the stepped rangelets render
+    gaps = []
+    for idx in range(len(plainArray) - 1):
+        gapFrom, gapTo = plainArray[idx][1] + 1, plainArray[idx + 1][0] - 1
+        clippedArray = [clip_progression(elem, gapFrom, gapTo) for elem in steppedArray]
+        gapCost = gapTo - gapFrom + 1 - count_frames([elem for elem in clippedArray if elem is not None])
+        gaps.append((gapCost, idx))
+    gaps.sort()
+
+    mergesNeeded = 0
+    if 0 < maxTakes and len(steppedArray) + min(1, len(plainArray)) <= maxTakes:
+        mergesNeeded = min(len(plainArray) - 1, max(0, len(plainArray) + len(steppedArray) - maxTakes))
+
+    bridged = set()
+    extraFrames = 0
+    for gapCost, idx in gaps:
+        if len(bridged) >= mergesNeeded and extraFrames + gapCost > maxOverhead:
+            break
+        bridged.add(idx)
+        extraFrames += gapCost
+
+    if 0 >= len(bridged):
+        return rangeArray, 0
 
-            # Just add this new rangelet to out array
+    outArray = []
+    for idx, elem in enumerate(plainArray):
+        if 0 < idx and idx - 1 in bridged:
+            outArray[-1][1] = elem[1]
+        else:
             outArray.append(elem)
 
-    returnStr = sep = ''
-    for elem in outArray:
-        # Show: 1,2,3-6,7,8-10, etc
-        if elem[0] == elem[1]:
-            returnStr += sep + str(elem[0])
-        else:
-            returnStr += sep + str(elem[0]) + '-' + str(elem[1])
-        sep = ','
+    # Bridging may leave a stepped rangelet covered, normalising drops it
+    _, outArray = normalise_frame_ranges(outArray + steppedArray)
 
-    # Return both the string and array versions of the normalise data
-    return returnStr, outArray
+    return outArray, count_frames(outArray) - count_frames(rangeArray)
+
+# ===================================================================
+def get_take_budget():
+# ===================================================================
+    # Returns the maximum number of takes and the maximum extra frames
+    # from the config file.  Zero takes means no limit, zero extra frames
+    # no merging beyond what the takes need
+    # ...................................................................
+    config = get_config_values()
+    maxTakes = config.get(CONFIG_RANGER_SECTION, 'maxTakes', fallback='').strip()
+    maxOverhead = config.get(CONFIG_RANGER_SECTION, 'takeOverheadFrames', fallback='').strip()
+
+    return (int(maxTakes) if maxTakes.isdigit() else 0), (int(maxOverhead) if maxOverhead.isdigit() else 0)
+
+# ===================================================================
+def count_frames(rangeArray):
+# ===================================================================
+    # Returns the number of frames rendered by an array of rangelets
+    # ..............................................................
+    count = 0
+    for elem in rangeArray:
+        step = int(elem[2]) if isSteppedRangelet(elem) else 1
+        count += (int(elem[1]) - int(elem[0])) // step + 1
+
+    return count
 
 # ===================================================================
 def isValidNumber(numberStr):
@@ -194,6 +503,13 @@ def isMinus(char):
         return True
     return False
 
+# ===================================================================
+def isStep(char):
+# ===================================================================
+    if STEP_SIGN == char:
+        return True
+    return False
+
 # ===================================================================
 def isAnotherChar(char):
 # ===================================================================
@@ -221,6 +537,7 @@ def stateTransitionRangelet(rangelet):
     #       n--m
     #       n-m
     # Each of these is acceptable, where n and m are any numeric value
+    # The two limit forms may be followed by a frame step, e.g. n-m:s
     # We validate and reorganise the rangelet and return it, or blank if it is invalid
     # We use a state transition table to drive the validation process
 
@@ -231,6 +548,7 @@ def stateTransitionRangelet(rangelet):
     # n = end
     # x = exit
     # - = minus sign
+    # : = step sign
     # The table consists of:
     #   state       test    goto state      mask sign indicator
 
@@ -253,12 +571,21 @@ def stateTransitionRangelet(rangelet):
         ['4','isEnd','e',''],
         ['5','isDigit','5',''],
         ['5','isMinus','e',''],
+        ['5','isStep','7',''],
         ['5','isAnotherChar','e',''],
         ['5','isEnd','x',''],
         ['6','isDigit','5',''],
         ['6','isMinus','e',''],
         ['6','isAnotherChar','e',''],
         ['6','isEnd','e',''],
+        ['7','isDigit','8',''],
+        ['7','isMinus','e',''],
+        ['7','isAnotherChar','e',''],
+        ['7','isEnd','e',''],
+        ['8','isDigit','8',''],
+        ['8','isMinus','e',''],
+        ['8','isAnotherChar','e',''],
+        ['8','isEnd','x',''],
         ]
 
     config = get_config_values()
@@ -298,16 +625,26 @@ def stateTransitionRangelet(rangelet):
     return returnRangelet
 
 # ===================================================================
-def get_render_settings():
+def get_render_settings(doc=None):
 # ===================================================================
     # Gets render settings from the current active set
+    # The document defaults to the active document
     # .....................................................
 
-    activeDocument = c4d.documents.GetActiveDocument()
-    renderData = activeDocument.GetActiveRenderData()
+    if doc is None:
+        doc = c4d.documents.GetActiveDocument()
+    renderData = doc.GetActiveRenderData()
     if renderData is None:
         raise RuntimeError("Failed to retrieve the active render data")
 
+    return get_renderData_settings(renderData)
+
+# ===================================================================
+def get_renderData_settings(renderData):
+# ===================================================================
+    # Gets render settings from the given render data
+    # ...............................................
+
     return {
         RANGE_FROM: int(renderData[c4d.RDATA_FRAMEFROM].Get() * renderData[c4d.RDATA_FRAMERATE]),
         RANGE_TO: int(renderData[c4d.RDATA_FRAMETO].Get() * renderData[c4d.RDATA_FRAMERATE]),
@@ -316,6 +653,31 @@ def get_render_settings():
         PATH: renderData[c4d.RDATA_PATH]
     }
 
+# ===================================================================
+def iterate_takes(takeData):
+# ===================================================================
+    # Yields every take in the document, starting with the main take
+    # ..............................................................
+    takes = [takeData.GetMainTake()]
+    while 0 < len(takes):
+        take = takes.pop()
+        if take is None:
+            continue
+        yield take
+        takes.append(take.GetNext())
+        takes.append(take.GetDown())
+
+# ===================================================================
+def get_job_take(doc, sourceTake):
+# ===================================================================
+    # Returns the take whose output a job renders, a source take of None
+    # meaning the main take, or None if the document has no take data
+    # ....................................................................
+    if sourceTake is not None or doc.GetTakeData() is None:
+        return sourceTake
+
+    return doc.GetTakeData().GetMainTake()
+
 # ===================================================================
 def get_projectFullPath():
 # ===================================================================
@@ -387,12 +749,33 @@ def getTestSequenceNumber(sequenceNumber, seqLen):
     return testSequenceNumberStr
 
 # ===================================================================
-def get_ResultsOutputDirectory():
+def split_output_path(savePath, projectName=None):
+# ===================================================================
+    # Splits a resolved save path into the output folder and the file prefix,
+    # which is the last element of the list of folders.  The project name
+    # defaults to that of the currently loaded project
+    # .......................................................................
+    pathLst = savePath.split(os.sep)
+    filePrefix = pathLst.pop()
+    if '$prj' == filePrefix:
+        filePrefix = get_projectName() if projectName is None else projectName
+
+    filePrefix = filePrefix.replace('.c4d', '')
+
+    # Put the remaining path elements back into a string
+    return os.sep.join(pathLst), filePrefix
+
+# ===================================================================
+def get_ResultsOutputDirectory(doc=None, activeRenderData=None, take=None):
 # ===================================================================
     # Gets the directory from the project settings
+    # The document and render data default to the active ones, the take
+    # is only needed where the save path uses the $take token
     # ............................................
-    doc = documents.GetActiveDocument()
-    activeRenderData = doc.GetActiveRenderData()
+    if doc is None:
+        doc = documents.GetActiveDocument()
+    if activeRenderData is None:
+        activeRenderData = doc.GetActiveRenderData()
     if None == activeRenderData:
         raise RuntimeError("Failed to retrieve the active render data")
     # Check to see if we have a save path defined
@@ -400,6 +783,9 @@ def get_ResultsOutputDirectory():
         return False
 
     # Note how to resolve tokens in the render data
-    savePath = c4d.modules.tokensystem.StringConvertTokens(activeRenderData[c4d.RDATA_PATH], rpData={'_doc': doc, '_rData': activeRenderData})
+    rpData = {'_doc': doc, '_rData': activeRenderData}
+    if take is not None:
+        rpData['_take'] = take
+    savePath = c4d.modules.tokensystem.StringConvertTokens(activeRenderData[c4d.RDATA_PATH], rpData=rpData)
 
     return savePath
\ No newline at end of file
@@ -4,29 +4,109 @@ Copyright:      PowerHouse Industries Nov 2023
 Author:         Brian Etheridge
 """
 
-import c4d, time
+import os, c4d, time
 from c4d import documents
 from c4d import gui
-import rb_functions
+import rb_functions, rb_job_journal, rb_metrics, rb_status_server, rb_render_pool
 
 config = rb_functions.get_config_values()
 debug = bool(int(config.get(rb_functions.CONFIG_SECTION, 'debug')))
 verbose = bool(int(config.get(rb_functions.CONFIG_SECTION, 'verbose')))
 
+# Names of the temporary takes start with this, which is how orphans are found
+TEMP_TAKE_PREFIX = "Take for RenderData "
+# Seconds to wait for a Picture Viewer render to start before taking it as finished
+RENDER_START_GRACE = 10.0
+
+# The Picture Viewer render in progress, if any, see poll_picture_viewer_render
+_pictureViewerRender = None
+# Journal ids of the jobs of the last submission, see get_last_job_ids
+_lastJobIds = []
+
+# ===================================================================
+def set_take_token(renderData, takeName):
+# ===================================================================
+    # The temporary takes have names of their own, so the $take token in
+    # the save paths of their render data is replaced by the name of the
+    # take they render for, which is what the scans of the output expect
+    # ......................................................................
+    for pathId in [c4d.RDATA_PATH, c4d.RDATA_MULTIPASS_FILENAME]:
+        if '$take' in renderData[pathId]:
+            renderData[pathId] = renderData[pathId].replace('$take', takeName)
+
+# ===================================================================
+def get_journal_output_path(doc, savePath):
+# ===================================================================
+    # Splits the resolved save path into the output folder and file prefix
+    # to journal.  A relative save path is relative to the project folder,
+    # so the folder can be scanned whatever the working directory
+    # .....................................................................
+    outputPath, filePrefix = rb_functions.split_output_path(savePath)
+    if False == os.path.isabs(outputPath):
+        outputPath = os.path.normpath(os.path.join(doc.GetDocumentPath(), outputPath))
+
+    return outputPath, filePrefix
+
 # ===================================================================
 def handle_render_takes(customFrameRangesAry):
 # ===================================================================
     # Submits a render request for one or more frames to the BatchRender queue
+    # using the active render data
     # ........................................................................
 
+    return handle_render_take_jobs([(None, None, customFrameRangesAry)])
+
+# ===================================================================
+def optimise_take_jobs(takeJobs):
+# ===================================================================
+    # Merges the scattered rangelets of each (source take, render data,
+    # array of rangelets) job to keep within the take budget, so that the
+    # merged ranges can be confirmed before they are submitted.  Returns
+    # the jobs and the number of extra frames they render
+    # ..................................................................
+    maxTakes, maxOverhead = rb_functions.get_take_budget()
+    optimisedJobs = []
+    totalExtraFrames = 0
+    for sourceTake, sourceRenderData, customFrameRangesAry in takeJobs:
+        optimisedRangesAry, extraFrames = rb_functions.optimise_take_budget(customFrameRangesAry, maxTakes, maxOverhead)
+        if len(optimisedRangesAry) < len(customFrameRangesAry):
+            print("Merged " + str(len(customFrameRangesAry)) + " ranges into " + str(len(optimisedRangesAry)) +
+                  " takes, rendering " + str(extraFrames) + " extra frames")
+            customFrameRangesAry = optimisedRangesAry
+            totalExtraFrames += extraFrames
+        optimisedJobs.append((sourceTake, sourceRenderData, customFrameRangesAry))
+
+    return optimisedJobs, totalExtraFrames
+
+# ===================================================================
+def handle_render_take_jobs(takeJobs):
+# ===================================================================
+    # Submits a render request for the frame ranges of one or more takes.
+    # Each job is a tuple of (source take, render data, array of rangelets).
+    # A temporary take is created under the source take for each rangelet,
+    # so that it inherits the camera and overrides of the source take, and
+    # all the temporary takes are rendered together.  A source take of None
+    # means the main take, and render data of None the active render data.
+    # The jobs are rendered as they are, see optimise_take_jobs.  Rendering
+    # carries on after this returns, poll_picture_viewer_render picks up
+    # when it has finished
+    # ........................................................................
+    global _pictureViewerRender, _lastJobIds
+
     newRenderArray = []
     newTakeArray = []
+    checkedTakes = []
+    jobIds = []
     takeData = None
     result = False
+    rangesSubmitted = framesSubmitted = 0
+    phaseTimer = rb_metrics.PhaseTimer()
     try:
         if True == debug:
             print("In handle_render_queue")
 
+        phaseTimer.start('prepare')
+
         doc = documents.GetActiveDocument()
 
         # Gets the TakeData from the active document (holds all information about Takes)
@@ -38,56 +118,101 @@ def handle_render_takes(customFrameRangesAry):
         if activeRenderData is None:
             raise RuntimeError("Failed to retrieve the active render data")
 
-        # Check to see if we have a save path defined
-        savePath = rb_functions.get_ResultsOutputDirectory()
-        if False == savePath:
-            print("WARNING: No save path has been defined")
+        # Only the temporary takes should be rendered, so unmark the others for now
+        for take in rb_functions.iterate_takes(takeData):
+            if take.IsChecked():
+                checkedTakes.append(take)
+                take.SetChecked(False)
 
-        print("Rendering selected takes with save path: " + savePath)
+        for sourceTake, sourceRenderData, customFrameRangesAry in takeJobs:
+            if sourceRenderData is None:
+                sourceRenderData = activeRenderData
+            # The take whose name the output is saved under
+            nameTake = rb_functions.get_job_take(doc, sourceTake)
 
-        for range in customFrameRangesAry:
-            frameFrom = int(range[0])
-            frameTo = int(range[1])
-            if True == debug:
-                print("Adding entry for range limit from: " + str(frameFrom) + " to " + str(frameTo))
+            rangesSubmitted += len(customFrameRangesAry)
+            framesSubmitted += rb_functions.count_frames(customFrameRangesAry)
+            phaseTimer.start('create_takes')
 
-            # Create new render data
-            if True == verbose:
-                print("Cloning render data")
-            renderData = activeRenderData.GetClone()
+            # Check to see if we have a save path defined
+            savePath = rb_functions.get_ResultsOutputDirectory(doc, sourceRenderData, nameTake)
+            if False == savePath:
+                print("WARNING: No save path has been defined")
+            else:
+                print("Rendering selected takes with save path: " + savePath)
 
-            # Save the render for later housekeeping
-            newRenderArray.append(renderData)
+            jobTakeArray = []
+            for range in customFrameRangesAry:
+                frameFrom = int(range[0])
+                frameTo = int(range[1])
+                if True == debug:
+                    print("Adding entry for range limit from: " + str(frameFrom) + " to " + str(frameTo))
 
-            # Set the chunk frame range in this instance of the project
-            renderData[c4d.RDATA_FRAMEFROM] = c4d.BaseTime(frameFrom, renderData[c4d.RDATA_FRAMERATE])
-            renderData[c4d.RDATA_FRAMETO] = c4d.BaseTime(frameTo, renderData[c4d.RDATA_FRAMERATE])
+                # Create new render data
+                if True == verbose:
+                    print("Cloning render data")
+                renderData = sourceRenderData.GetClone()
 
-            doc.InsertRenderData(renderData)
+                # Save the render for later housekeeping
+                newRenderArray.append(renderData)
 
-            # Creates a Take and defines the render data
-            takeName = "Take for RenderData " + str(range)
-            if True == debug:
-                print("Adding Take: " + str(takeName))
+                # Set the chunk frame range in this instance of the project
+                renderData[c4d.RDATA_FRAMEFROM] = c4d.BaseTime(frameFrom, renderData[c4d.RDATA_FRAMERATE])
+                renderData[c4d.RDATA_FRAMETO] = c4d.BaseTime(frameTo, renderData[c4d.RDATA_FRAMERATE])
+                # A stepped rangelet is rendered by the one take, using the frame step
+                if True == rb_functions.isSteppedRangelet(range):
+                    renderData[c4d.RDATA_FRAMESTEP] = int(range[2])
+                set_take_token(renderData, nameTake.GetName())
 
-            newTake = takeData.AddTake(takeName, None, None)
-            if newTake is None:
-                raise RuntimeError("Failed to create a new take")
+                doc.InsertRenderData(renderData)
 
-            if True == debug:
-                print("New take was added: " + takeName)
-            newTake.SetRenderData(takeData, renderData)
-            if True == debug:
-                print("Marking take as selected")
-            newTake.SetChecked(True)
+                # Creates a Take and defines the render data
+                takeName = TEMP_TAKE_PREFIX + str(range)
+                if sourceTake is not None:
+                    takeName += " of " + sourceTake.GetName()
+                if True == debug:
+                    print("Adding Take: " + str(takeName))
+
+                newTake = takeData.AddTake(takeName, sourceTake, None)
+                if newTake is None:
+                    raise RuntimeError("Failed to create a new take")
 
-            # Save the take for later housekeeping
-            newTakeArray.append(newTake)
+                if True == debug:
+                    print("New take was added: " + takeName)
+                newTake.SetRenderData(takeData, renderData)
+                if True == debug:
+                    print("Marking take as selected")
+                newTake.SetChecked(True)
+
+                # Save the take for later housekeeping
+                newTakeArray.append(newTake)
+                jobTakeArray.append(newTake)
+
+            # Journal the submission so that it can be resumed should Cinema 4D crash
+            phaseTimer.start('journal')
+            if False != savePath and 0 < len(jobTakeArray):
+                outputPath, filePrefix = get_journal_output_path(doc, savePath)
+                jobIds.append(rb_job_journal.record_submission(
+                    rb_functions.get_projectFullPath(),
+                    outputPath,
+                    filePrefix,
+                    customFrameRangesAry,
+                    [take.GetName() for take in jobTakeArray]))
 
         if True == debug:
-            print("Rendering Take: from " + str(renderData[c4d.RDATA_FRAMEFROM].Get()) + " to " + str(renderData[c4d.RDATA_FRAMETO].Get()))
+            print("Rendering " + str(len(newTakeArray)) + " takes")
+
+        # The status server answers while the render holds the main thread
+        rb_status_server.update_status(rb_status_server.SECTION_SUBMISSION, {
+            'state': 'rendering',
+            'started': round(time.time(), 3),
+            'takes': len(newTakeArray),
+            'ranges': rangesSubmitted,
+            'frames': framesSubmitted
+        })
 
         # Render Marked Takes to Picture Viewer
+        phaseTimer.start('render')
         c4d.CallCommand(431000068)  # ID_431000068
 
         if True == debug:
@@ -104,6 +229,7 @@ def handle_render_takes(customFrameRangesAry):
         gui.MessageDialog(message)
 
     # Housekeeping, remove the temporary render data and takes
+    phaseTimer.start('housekeeping')
     if True == debug:
         print("Housekeeping the removal of render data and takes")
     if 0 < len(newRenderArray):
@@ -118,4 +244,227 @@ def handle_render_takes(customFrameRangesAry):
                 print("Deleting take")
             takeData.DeleteTake(take)
 
+    # Mark the takes which were marked before
+    for take in checkedTakes:
+        take.SetChecked(True)
+
+    _lastJobIds = list(jobIds)
+    if True == result:
+        # Still rendering, a render which has not yet finished is taken over
+        if _pictureViewerRender is not None:
+            jobIds = _pictureViewerRender['jobIds'] + jobIds
+        _pictureViewerRender = {
+            'submitted': time.time(),
+            'seen': False,
+            'jobIds': jobIds,
+            'takes': len(newTakeArray),
+            'ranges': rangesSubmitted,
+            'frames': framesSubmitted
+        }
+    else:
+        for jobId in jobIds:
+            rb_job_journal.record_completion(jobId)
+
+        rb_status_server.update_status(rb_status_server.SECTION_SUBMISSION, {
+            'state': 'failed',
+            'finished': round(time.time(), 3),
+            'takes': len(newTakeArray),
+            'ranges': rangesSubmitted,
+            'frames': framesSubmitted
+        })
+
+    rb_metrics.record_metrics(rb_metrics.KIND_SUBMISSION, {
+        'succeeded': 1 if True == result else 0,
+        'takes_created': len(newTakeArray),
+        'ranges_submitted': rangesSubmitted,
+        'frames_submitted': framesSubmitted,
+        'phase_seconds': phaseTimer.getSeconds()
+    })
+
     return result
+
+# ===================================================================
+def poll_picture_viewer_render():
+# ===================================================================
+    # Returns True once the Picture Viewer render of the takes submitted
+    # has finished, or if there is none.  The render may not have started
+    # by the time the command returns, so it is given a few seconds to.
+    # Once it has finished the journal entries are completed and the
+    # status updated.  Uses the Cinema 4D API, so must run on the main
+    # thread, e.g. from the dialog timer
+    # ....................................................................
+    global _pictureViewerRender
+    render = _pictureViewerRender
+    if render is None:
+        return True
+
+    if True == c4d.CheckIsRunning(c4d.CHECKISRUNNING_EXTERNALRENDERING):
+        render['seen'] = True
+        return False
+    if False == render['seen'] and RENDER_START_GRACE >= time.time() - render['submitted']:
+        return False
+
+    _pictureViewerRender = None
+    for jobId in render['jobIds']:
+        rb_job_journal.record_completion(jobId)
+
+    rb_status_server.update_status(rb_status_server.SECTION_SUBMISSION, {
+        'state': 'finished',
+        'finished': round(time.time(), 3),
+        'takes': render['takes'],
+        'ranges': render['ranges'],
+        'frames': render['frames']
+    })
+    if True == debug:
+        print("Picture Viewer render finished")
+
+    return True
+
+# ===================================================================
+def is_picture_viewer_rendering():
+# ===================================================================
+    return _pictureViewerRender is not None
+
+# ===================================================================
+def get_last_job_ids():
+# ===================================================================
+    return list(_lastJobIds)
+
+# ===================================================================
+def get_rendering_job_ids():
+# ===================================================================
+    # Journal ids of the jobs the Picture Viewer is still rendering
+    # ...............................................................
+    return [] if _pictureViewerRender is None else list(_pictureViewerRender['jobIds'])
+
+# ===================================================================
+def handle_render_pool_jobs(takeJobs):
+# ===================================================================
+    # Submits the frame ranges of one or more takes to the local pool of
+    # Commandline renderers, in place of creating temporary takes.  The
+    # jobs are the same (source take, render data, array of rangelets)
+    # tuples.  Returns the started render pool, or None on error.  The
+    # caller polls the pool and passes it to finish_render_pool
+    # ..................................................................
+    global _lastJobIds
+    renderPool = None
+    jobIds = []
+    try:
+        doc = documents.GetActiveDocument()
+        poolJobs = []
+        journalEntries = []
+        for sourceTake, sourceRenderData, customFrameRangesAry in takeJobs:
+            # Rendered as the main take where there is no source take, like the temporary takes
+            jobTake = rb_functions.get_job_take(doc, sourceTake)
+            takeName = None if jobTake is None else jobTake.GetName()
+            poolJobs.append((takeName, customFrameRangesAry))
+
+            savePath = rb_functions.get_ResultsOutputDirectory(doc, sourceRenderData, jobTake)
+            if False != savePath:
+                outputPath, filePrefix = get_journal_output_path(doc, savePath)
+                journalEntries.append((outputPath, filePrefix, customFrameRangesAry, [] if takeName is None else [takeName]))
+
+        renderPool = rb_render_pool.prepare_render_pool(poolJobs, doc)
+        renderPool.start()
+
+        # Journal the submission so that it can be resumed should Cinema 4D crash.
+        # Only once the pool has started, so a pool which failed to start is not
+        # offered again as unfinished
+        for outputPath, filePrefix, rangeArray, takeNames in journalEntries:
+            jobIds.append(rb_job_journal.record_submission(
+                rb_functions.get_projectFullPath(), outputPath, filePrefix, rangeArray, takeNames))
+        renderPool.jobIds = jobIds
+        _lastJobIds = list(jobIds)
+
+        rb_status_server.update_status(rb_status_server.SECTION_SUBMISSION, {
+            'state': 'rendering',
+            'started': round(time.time(), 3),
+            'chunks': len(renderPool.chunks),
+            'processes': renderPool.processes,
+            'frames': renderPool.framesSubmitted
+        })
+
+    except Exception as e:
+        message = "Error starting the render pool. Error message: " + str(e)
+        print(message)
+        gui.MessageDialog(message)
+        # The pool is not handed back, so nothing would ever finish it or its jobs
+        if renderPool is not None:
+            renderPool.cancel()
+        for jobId in jobIds:
+            rb_job_journal.record_completion(jobId)
+        _lastJobIds = []
+        return None
+
+    return renderPool
+
+# ===================================================================
+def finish_render_pool(renderPool):
+# ===================================================================
+    # Records the outcome of a finished render pool.  The journal entries
+    # are only completed if every chunk rendered, otherwise they are left
+    # for the journal to offer again.  Returns True if every chunk rendered
+    # .....................................................................
+    failedChunks = renderPool.getFailedChunks()
+    result = 0 >= len(failedChunks)
+    if True == result:
+        for jobId in renderPool.jobIds:
+            rb_job_journal.record_completion(jobId)
+
+    rb_status_server.update_status(rb_status_server.SECTION_SUBMISSION, {
+        'state': 'finished' if True == result else ('cancelled' if renderPool.isCancelled() else 'failed'),
+        'finished': round(time.time(), 3),
+        'chunks': len(renderPool.chunks),
+        'failedChunks': [chunk.rangelet for chunk in failedChunks],
+        'frames': renderPool.framesSubmitted
+    })
+
+    rb_metrics.record_metrics(rb_metrics.KIND_SUBMISSION, {
+        'succeeded': 1 if True == result else 0,
+        'chunks_rendered': len(renderPool.chunks) - len(failedChunks),
+        'chunks_failed': len(failedChunks),
+        'frames_submitted': renderPool.framesSubmitted,
+        'phase_seconds': {'render': round(renderPool.duration, 6)}
+    })
+
+    return result
+
+# ===================================================================
+def find_orphaned_takes(doc=None):
+# ===================================================================
+    # Returns the temporary takes left in the document by a render
+    # which did not get as far as its housekeeping
+    # ............................................................
+    if doc is None:
+        doc = documents.GetActiveDocument()
+
+    takeData = doc.GetTakeData()
+    if takeData is None:
+        return []
+
+    orphans = []
+    for take in rb_functions.iterate_takes(takeData):
+        if take.GetName().startswith(TEMP_TAKE_PREFIX):
+            orphans.append(take)
+
+    return orphans
+
+# ===================================================================
+def remove_orphaned_takes(orphans, doc=None):
+# ===================================================================
+    # Removes temporary takes along with the render data they were given
+    # ..................................................................
+    if doc is None:
+        doc = documents.GetActiveDocument()
+
+    takeData = doc.GetTakeData()
+    activeRenderData = doc.GetActiveRenderData()
+    for take in orphans:
+        renderData = take.GetRenderData(takeData)
+        if True == debug:
+            print("Deleting orphaned take: " + take.GetName())
+        takeData.DeleteTake(take)
+        if renderData is not None and renderData != activeRenderData:
+            renderData.Remove()
+
+    c4d.EventAdd()
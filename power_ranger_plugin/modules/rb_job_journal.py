@@ -0,0 +1,213 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+"""
+
+import os, json, time, uuid
+import rb_functions, rb_scan_output
+
+config = rb_functions.get_config_values()
+debug = bool(int(config.get(rb_functions.CONFIG_SECTION, 'debug')))
+verbose = bool(int(config.get(rb_functions.CONFIG_SECTION, 'verbose')))
+
+JOURNAL_FILE = rb_functions.__root__ + '/config/journal.jsonl'
+
+# Journal events
+EVENT_SUBMIT = 'submit'
+EVENT_COMPLETE = 'complete'
+EVENT_RESOLVED = 'resolved'
+EVENT_LINK_PLAN = 'links'
+
+# ===================================================================
+def append_journal_entry(entry):
+# ===================================================================
+    # Appends one entry to the journal.  The entry is flushed to disk
+    # straight away so that it survives Cinema 4D crashing
+    # ...............................................................
+    entry['time'] = time.time()
+    with open(JOURNAL_FILE, 'a') as journal:
+        journal.write(json.dumps(entry) + '\n')
+        journal.flush()
+        os.fsync(journal.fileno())
+
+# ===================================================================
+def read_journal():
+# ===================================================================
+    # Returns the list of journal entries.  A partly written last line,
+    # left by a crash, is ignored
+    # .................................................................
+    entries = []
+    if False == os.path.isfile(JOURNAL_FILE):
+        return entries
+
+    with open(JOURNAL_FILE, 'r') as journal:
+        for line in journal:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                print("WARNING: ignoring unreadable journal entry")
+
+    return entries
+
+# ===================================================================
+def record_submission(projectFullPath, savePath, filePrefix, rangeArray, takeNames):
+# ===================================================================
+    # Records the submission of a set of frame ranges and returns its job id
+    # ......................................................................
+    jobId = uuid.uuid4().hex
+    append_journal_entry({
+        'event': EVENT_SUBMIT,
+        'jobId': jobId,
+        'project': projectFullPath,
+        'savePath': savePath,
+        'filePrefix': filePrefix,
+        'ranges': [[int(limit) for limit in rangelet] for rangelet in rangeArray],
+        'takes': takeNames
+    })
+    if True == debug:
+        print("Journal submission recorded: " + jobId)
+
+    return jobId
+
+# ===================================================================
+def record_completion(jobId):
+# ===================================================================
+    # Records that the housekeeping of a submission has run
+    # .....................................................
+    append_journal_entry({'event': EVENT_COMPLETE, 'jobId': jobId})
+
+# ===================================================================
+def record_resolution(jobIds):
+# ===================================================================
+    # Records that submissions no longer need to be reconciled
+    # ........................................................
+    for jobId in jobIds:
+        append_journal_entry({'event': EVENT_RESOLVED, 'jobId': jobId})
+
+# ===================================================================
+def get_pending_jobs(projectFullPath):
+# ===================================================================
+    # Returns the submissions for the project which have not been resolved,
+    # in the order they were submitted.  A job is marked 'completed' once
+    # its render has run to the end
+    # .....................................................................
+    jobs = {}
+    resolved = set()
+    for entry in read_journal():
+        if EVENT_SUBMIT == entry.get('event') and projectFullPath == entry.get('project'):
+            jobs[entry['jobId']] = entry
+        elif EVENT_COMPLETE == entry.get('event') and entry.get('jobId') in jobs:
+            jobs[entry['jobId']]['completed'] = True
+        elif EVENT_RESOLVED == entry.get('event'):
+            resolved.add(entry.get('jobId'))
+
+    return [job for jobId, job in jobs.items() if jobId not in resolved]
+
+# ===================================================================
+def record_link_plan(projectFullPath, linkPlan, jobIds, submitTime):
+# ===================================================================
+    # Records the images to be linked from the representative of each run
+    # of identical frames once it has rendered, along with the ids of the
+    # jobs which render them and when they were submitted.  Returns the
+    # plan's id
+    # ....................................................................
+    jobId = uuid.uuid4().hex
+    append_journal_entry({
+        'event': EVENT_LINK_PLAN,
+        'jobId': jobId,
+        'project': projectFullPath,
+        'folders': linkPlan,
+        'jobIds': jobIds,
+        'submitted': submitTime
+    })
+    if True == debug:
+        print("Journal link plan recorded: " + jobId)
+
+    return jobId
+
+# ===================================================================
+def get_pending_link_plans(projectFullPath):
+# ===================================================================
+    # Returns the link plans for the project which have not been resolved
+    # ...................................................................
+    plans = {}
+    resolved = set()
+    for entry in read_journal():
+        if EVENT_LINK_PLAN == entry.get('event') and projectFullPath == entry.get('project'):
+            plans[entry['jobId']] = entry
+        elif EVENT_RESOLVED == entry.get('event'):
+            resolved.add(entry.get('jobId'))
+
+    return [plan for jobId, plan in plans.items() if jobId not in resolved]
+
+# ===================================================================
+def get_finished_job_ids():
+# ===================================================================
+    # Returns the ids of the jobs whose render has run to the end, or which
+    # have been resolved
+    # ....................................................................
+    finished = set()
+    for entry in read_journal():
+        if entry.get('event') in [EVENT_COMPLETE, EVENT_RESOLVED]:
+            finished.add(entry.get('jobId'))
+
+    return finished
+
+# ===================================================================
+def reconcile_journal(projectFullPath, liveJobIds=()):
+# ===================================================================
+    # Checks the pending submissions of the project against the output folder.
+    # Jobs whose render ran to the end, and those still rendering, are left
+    # out.  Each distinct output folder and window is listed once, however
+    # many jobs share it, and only the frames within the submitted ranges
+    # are checked.
+    # A frame is unfinished when its image is missing or older than the
+    # submission.  Jobs with every frame rendered are resolved; the others
+    # are returned along with the array of unfinished frame ranges
+    # .........................................................................
+    scans = {}
+    finishedJobIds = []
+    unfinishedJobs = []
+    unfinishedFrames = []
+    for job in get_pending_jobs(projectFullPath):
+        if True == job.get('completed', False) or job['jobId'] in liveJobIds:
+            continue
+        # Only the frames within the job's ranges are looked at, so other
+        # versions of the sequence in the folder do not get in the way
+        window = (min(rangelet[0] for rangelet in job['ranges']), max(rangelet[1] for rangelet in job['ranges']), 1)
+        # Entries journalled before save paths were resolved may be relative to the project folder
+        savePath = job['savePath']
+        if False == os.path.isabs(savePath):
+            savePath = os.path.normpath(os.path.join(os.path.dirname(projectFullPath), savePath))
+        folderKey = (savePath, job['filePrefix'], window)
+        if folderKey not in scans:
+            try:
+                scans[folderKey] = rb_scan_output.scan_output_folder(savePath, job['filePrefix'], window=window)
+            except Exception as e:
+                print("WARNING: unable to scan " + savePath + " to reconcile the journal: " + str(e))
+                scans[folderKey] = None
+        scanResult = scans[folderKey]
+        if scanResult is None:
+            continue
+
+        jobFrames = []
+        for rangelet in job['ranges']:
+            step = rangelet[2] if 2 < len(rangelet) else 1
+            for frame in range(rangelet[0], rangelet[1] + 1, step):
+                fileDetails = scanResult.frames.get(frame)
+                if fileDetails is None or fileDetails[0] < job['time']:
+                    jobFrames.append(frame)
+
+        if 0 >= len(jobFrames):
+            finishedJobIds.append(job['jobId'])
+        else:
+            if True == debug:
+                print("Job " + job['jobId'] + " has " + str(len(jobFrames)) + " unfinished frames")
+            unfinishedJobs.append(job)
+            unfinishedFrames += jobFrames
+
+    if 0 < len(finishedJobIds):
+        record_resolution(finishedJobIds)
+
+    return unfinishedJobs, unfinishedFrames
@@ -0,0 +1,157 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+
+Description:
+    Writes a metrics record for each gap scan and submission, either as a
+    line of JSON appended to a file or as a Prometheus textfile, for the
+    node exporter textfile collector to pick up.  Nothing is sent over the
+    network.  Set 'metricsFormat' in the config file to 'jsonl' or
+    'prometheus' to switch it on, and 'metricsPath' to choose the file.
+"""
+
+import os, json, time
+import rb_functions, rb_scan_output, rb_status_server
+
+config = rb_functions.get_config_values()
+debug = bool(int(config.get(rb_functions.CONFIG_SECTION, 'debug')))
+verbose = bool(int(config.get(rb_functions.CONFIG_SECTION, 'verbose')))
+
+FORMAT_JSONL = 'jsonl'
+FORMAT_PROMETHEUS = 'prometheus'
+
+DEFAULT_PATHS = {
+    FORMAT_JSONL: rb_functions.__root__ + '/config/metrics.jsonl',
+    FORMAT_PROMETHEUS: rb_functions.__root__ + '/config/power_ranger.prom'
+}
+
+METRIC_PREFIX = 'power_ranger_'
+
+# Metric records
+KIND_SCAN = 'scan'
+KIND_SUBMISSION = 'submission'
+
+# The latest record of each kind, a Prometheus textfile holds them all
+_latestRecords = {}
+
+# ===================================================================
+class PhaseTimer(object):
+# ===================================================================
+    """
+    Accumulates the time spent in the named phases of a piece of work
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.currentPhase = None
+        self.phaseStart = None
+
+    # ===================================================================
+    def start(self, phase):
+    # ===================================================================
+        # Starts timing the phase, which ends the phase before it
+        self.stop()
+        self.currentPhase = phase
+        self.phaseStart = time.perf_counter()
+
+    # ===================================================================
+    def stop(self):
+    # ===================================================================
+        if self.currentPhase is not None:
+            self.phases[self.currentPhase] = self.phases.get(self.currentPhase, 0.0) + time.perf_counter() - self.phaseStart
+            self.currentPhase = None
+
+    # ===================================================================
+    def getSeconds(self):
+    # ===================================================================
+        # Returns the dictionary of phase name to seconds, rounded to the microsecond
+        self.stop()
+        return {phase: round(seconds, 6) for phase, seconds in self.phases.items()}
+
+# ===================================================================
+def get_metrics_settings():
+# ===================================================================
+    # Returns the metrics format and file from the config file.  A blank
+    # format means metrics are switched off
+    # ..................................................................
+    config = rb_functions.get_config_values()
+    metricsFormat = config.get(rb_functions.CONFIG_RANGER_SECTION, 'metricsFormat', fallback='').strip().lower()
+    if metricsFormat not in DEFAULT_PATHS:
+        return '', ''
+
+    metricsPath = config.get(rb_functions.CONFIG_RANGER_SECTION, 'metricsPath', fallback='').strip()
+    if '' == metricsPath:
+        metricsPath = DEFAULT_PATHS[metricsFormat]
+
+    return metricsFormat, metricsPath
+
+# ===================================================================
+def format_prometheus(records):
+# ===================================================================
+    # Formats the latest record of each kind in the Prometheus text format.
+    # Each numeric field becomes a gauge labelled with the project name, and
+    # a dictionary field, such as phase timings, gets a label for each key
+    # ......................................................................
+    lines = []
+    for kind, record in sorted(records.items()):
+        project = str(record.get('project', '')).replace('\\', '\\\\').replace('"', '\\"')
+        for field, value in sorted(record.items()):
+            metricName = METRIC_PREFIX + kind + '_' + field
+            if isinstance(value, dict):
+                lines.append('# TYPE ' + metricName + ' gauge')
+                for key, subValue in sorted(value.items()):
+                    lines.append(metricName + '{project="' + project + '",phase="' + str(key) + '"} ' + str(subValue))
+            elif isinstance(value, (int, float)) and False == isinstance(value, bool):
+                lines.append('# TYPE ' + metricName + ' gauge')
+                lines.append(metricName + '{project="' + project + '"} ' + str(value))
+
+    return '\n'.join(lines) + '\n'
+
+# ===================================================================
+def record_metrics(kind, fields):
+# ===================================================================
+    # Passes a metrics record to the status server and writes it, if
+    # metrics are switched on.  Failing to write metrics never gets in
+    # the way of the scan or submission
+    # ................................................................
+    record = {'time': round(time.time(), 3), 'kind': kind, 'project': rb_functions.get_projectName()}
+    record.update(fields)
+    rb_status_server.update_metrics_status(kind, record)
+
+    metricsFormat, metricsPath = get_metrics_settings()
+    if '' == metricsFormat:
+        return
+
+    try:
+        if FORMAT_JSONL == metricsFormat:
+            with open(metricsPath, 'a') as metricsFile:
+                metricsFile.write(json.dumps(record) + '\n')
+        else:
+            _latestRecords[kind] = record
+            # Write then rename, so that the collector never reads half a file
+            tempPath = metricsPath + '.tmp'
+            with open(tempPath, 'w') as metricsFile:
+                metricsFile.write(format_prometheus(_latestRecords))
+            os.replace(tempPath, metricsPath)
+
+        if True == verbose:
+            print("Metrics recorded: " + json.dumps(record))
+
+    except Exception as e:
+        print("WARNING: unable to write metrics to " + metricsPath + ": " + str(e))
+
+# ===================================================================
+def record_scan_metrics(scanResults, duration):
+# ===================================================================
+    # Records the outcome of a gap scan of one or more output folders
+    # ...............................................................
+    record_metrics(KIND_SCAN, {
+        'folders_scanned': len(scanResults),
+        'files_scanned': sum(scanResult.filesScanned for scanResult in scanResults),
+        'scan_seconds': round(duration, 6),
+        'frames_found': sum(len(scanResult.frames) for scanResult in scanResults),
+        'frames_missing': sum(rb_functions.count_frames(rb_scan_output.calc_missing_ranges(scanResult)) for scanResult in scanResults),
+        'frames_stale': sum(len(scanResult.staleFrames) for scanResult in scanResults),
+        'frames_corrupt': sum(len(scanResult.corruptFrames) for scanResult in scanResults)
+    })
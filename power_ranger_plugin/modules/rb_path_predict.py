@@ -0,0 +1,290 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+
+Description:
+    Predicts the name of every image a render will write, by expanding the
+    render path template for each frame, take and pass, and compares the
+    expected files with what is in the output folders.
+"""
+
+import os, bisect
+import c4d
+from c4d import documents
+import rb_functions, rb_scan_output
+
+config = rb_functions.get_config_values()
+debug = bool(int(config.get(rb_functions.CONFIG_SECTION, 'debug')))
+verbose = bool(int(config.get(rb_functions.CONFIG_SECTION, 'verbose')))
+
+FRAME_TOKEN = '$frame'
+PASS_TOKENS = ['$userpass', '$pass']
+PRJ_TOKEN = '$prj'
+# Stands in for the frame number while the other tokens are resolved
+FRAME_MARKER = '@@frame@@'
+# Pass name of a layered multi-pass file, whose name carries no pass name
+LAYERED_PASS = 'multipass'
+
+# Name format: digits in the frame number, separator before it, whether an extension follows
+NAME_FORMATS = {
+    c4d.RDATA_NAMEFORMAT_0: (4, '', True),      # Name0000.TIF
+    c4d.RDATA_NAMEFORMAT_1: (4, '', False),     # Name0000
+    c4d.RDATA_NAMEFORMAT_2: (4, '.', False),    # Name.0000
+    c4d.RDATA_NAMEFORMAT_3: (3, '', True),      # Name000.TIF
+    c4d.RDATA_NAMEFORMAT_4: (3, '', False),     # Name000
+    c4d.RDATA_NAMEFORMAT_5: (3, '.', False),    # Name.000
+    c4d.RDATA_NAMEFORMAT_6: (4, '.', True),     # Name.0000.TIF
+}
+
+# Extension written for each image format, used to find an image without listing its folder
+IMAGE_EXTENSIONS = {
+    c4d.FILTER_TIF: '.tif',
+    c4d.FILTER_TGA: '.tga',
+    c4d.FILTER_BMP: '.bmp',
+    c4d.FILTER_IFF: '.iff',
+    c4d.FILTER_JPG: '.jpg',
+    c4d.FILTER_PICT: '.pct',
+    c4d.FILTER_PSD: '.psd',
+    c4d.FILTER_RLA: '.rla',
+    c4d.FILTER_RPF: '.rpf',
+    c4d.FILTER_B3D: '.b3d',
+    c4d.FILTER_HDR: '.hdr',
+    c4d.FILTER_EXR: '.exr',
+    c4d.FILTER_PNG: '.png',
+    c4d.FILTER_DPX: '.dpx',
+}
+
+# ===================================================================
+def get_output_templates(renderData):
+# ===================================================================
+    # Returns the list of (pass name, path template) pairs for the images
+    # the render data saves.  The regular image has a blank pass name.
+    # Multi-pass images saved as separate files get one entry per enabled
+    # pass, a layered multi-pass file gets a single LAYERED_PASS entry
+    # ...................................................................
+    templates = []
+    if renderData[c4d.RDATA_SAVEIMAGE] and "" != renderData[c4d.RDATA_PATH]:
+        templates.append(('', renderData[c4d.RDATA_PATH]))
+
+    if (renderData[c4d.RDATA_MULTIPASS_ENABLE] and renderData[c4d.RDATA_MULTIPASS_SAVEIMAGE]
+            and "" != renderData[c4d.RDATA_MULTIPASS_FILENAME]):
+        template = renderData[c4d.RDATA_MULTIPASS_FILENAME]
+        if renderData[c4d.RDATA_MULTIPASS_SAVEONEFILE]:
+            templates.append((LAYERED_PASS, template))
+        else:
+            multipass = renderData.GetFirstMultipass()
+            while multipass is not None:
+                if False == multipass.GetBit(c4d.BIT_VPDISABLED):
+                    templates.append((multipass.GetName(), template))
+                multipass = multipass.GetNext()
+
+    return templates
+
+# ===================================================================
+def needs_prediction(renderData):
+# ===================================================================
+    # The plain folder and file prefix scan copes with a save path whose only
+    # token is a $prj file prefix.  Any other token, or multi-pass images,
+    # need the expected files to be predicted
+    # .......................................................................
+    if renderData[c4d.RDATA_MULTIPASS_ENABLE] and renderData[c4d.RDATA_MULTIPASS_SAVEIMAGE]:
+        return True
+
+    pathLst = renderData[c4d.RDATA_PATH].split(os.sep)
+    if PRJ_TOKEN == pathLst[-1]:
+        pathLst.pop()
+
+    return 0 <= os.sep.join(pathLst).find('$')
+
+# ===================================================================
+def expand_static_template(doc, renderData, take, template, passName):
+# ===================================================================
+    # Resolves every token of the template apart from the frame number,
+    # which is left as a marker, and returns the folder and the file name
+    # pattern.  If the template has no $frame token the frame number is
+    # appended to the file name, as Cinema 4D does
+    # ...................................................................
+    nameFormat = NAME_FORMATS.get(renderData[c4d.RDATA_NAMEFORMAT], NAME_FORMATS[c4d.RDATA_NAMEFORMAT_0])
+
+    template = template.replace(FRAME_TOKEN, FRAME_MARKER)
+    # All the passes of a layered file are in the one image
+    if LAYERED_PASS == passName:
+        passName = ''
+    for passToken in PASS_TOKENS:
+        if 0 <= template.find(passToken):
+            template = template.replace(passToken, passName)
+            passName = ''
+
+    rpData = {'_doc': doc, '_rData': renderData}
+    if take is not None:
+        rpData['_take'] = take
+    expanded = c4d.modules.tokensystem.StringConvertTokens(template, rpData=rpData)
+
+    folder, fileName = os.path.split(expanded)
+    # A relative save path is relative to the project folder
+    if False == os.path.isabs(folder):
+        folder = os.path.normpath(os.path.join(doc.GetDocumentPath(), folder))
+
+    # Separate pass files carry the pass name unless the template placed it
+    if '' != passName:
+        fileName += '_' + passName
+
+    if 0 > fileName.find(FRAME_MARKER):
+        fileName += nameFormat[1] + FRAME_MARKER
+
+    return folder, fileName
+
+# ===================================================================
+def build_expected_files(doc, renderData, frames, take=None):
+# ===================================================================
+    # Expands the render path template for every frame and pass.  The
+    # tokens are resolved once per pass, after which each frame is no more
+    # than a string replacement.  Returns a dictionary of output folder to
+    # the expected file names in it, each mapped to (frame, pass name),
+    # and whether the names are followed by a file extension
+    # ....................................................................
+    nameFormat = NAME_FORMATS.get(renderData[c4d.RDATA_NAMEFORMAT], NAME_FORMATS[c4d.RDATA_NAMEFORMAT_0])
+
+    expectedFiles = {}
+    for passName, template in get_output_templates(renderData):
+        folder, fileName = expand_static_template(doc, renderData, take, template, passName)
+        if True == verbose:
+            print("Expected files for pass '" + passName + "': " + os.path.join(folder, fileName))
+
+        folderFiles = expectedFiles.setdefault(folder, {})
+        for frame in frames:
+            folderFiles[fileName.replace(FRAME_MARKER, str(frame).zfill(nameFormat[0]))] = (frame, passName)
+
+    return expectedFiles, nameFormat[2]
+
+# ===================================================================
+def match_expected_files(expectedFiles, hasExtension, frames, cutoff=None, progress=None, window=None):
+# ===================================================================
+    # Lists each distinct output folder once and matches its contents with
+    # the expected file names.  Only matching images are stat'ed.  A frame
+    # counts as rendered once the images of all of its passes exist.
+    # The frames must be in ascending order.  The window they were taken
+    # from, if given, is recorded with the result.  Progress, if given, is
+    # reported in chunks and cancellation checked after each entry
+    # .....................................................................
+    result = rb_scan_output.ScanResult(None, None, cutoff)
+    result.expectedFrames = frames
+    result.window = window
+    result.passFrames = {}
+    framesSeen = set()
+    highestFrame = None
+    for folder, folderFiles in expectedFiles.items():
+        if False == os.path.isdir(folder):
+            if True == debug:
+                print("Output folder does not yet exist: " + folder)
+        else:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    result.filesScanned += 1
+                    if progress is not None:
+                        progress.checkCancelled()
+                        if 0 == result.filesScanned % rb_scan_output.SCAN_CHUNK and highestFrame is not None:
+                            # Gaps so far are the expected frames below the highest frame seen
+                            progress.update(result.filesScanned, len(framesSeen), bisect.bisect_right(frames, highestFrame) - len(framesSeen))
+
+                    key = os.path.splitext(entry.name)[0] if True == hasExtension else entry.name
+                    expected = folderFiles.get(key)
+                    if expected is None or False == entry.is_file():
+                        continue
+
+                    stat = entry.stat()
+                    result.passFrames.setdefault(expected[1], {})[expected[0]] = (stat.st_mtime, stat.st_size)
+                    framesSeen.add(expected[0])
+                    highestFrame = expected[0] if highestFrame is None else max(highestFrame, expected[0])
+
+        # Passes with no images at all still need to be accounted for
+        for frame, passName in folderFiles.values():
+            result.passFrames.setdefault(passName, {})
+
+    combine_pass_frames(result, frames, cutoff)
+
+    if progress is not None:
+        progress.update(result.filesScanned, len(result.frames), len(result.missingFrames))
+
+    return result
+
+# ===================================================================
+def combine_pass_frames(result, frames, cutoff=None):
+# ===================================================================
+    # Works out which of the frames are rendered, missing, stale or corrupt
+    # from the images found for each pass
+    # .....................................................................
+    passFrames = list(result.passFrames.values())
+    for frame in frames:
+        fileDetails = [files.get(frame) for files in passFrames]
+        if 0 >= len(fileDetails) or None in fileDetails:
+            result.missingFrames.append(frame)
+            continue
+
+        result.frames[frame] = (min(details[0] for details in fileDetails), sum(details[1] for details in fileDetails))
+        if cutoff is not None and result.frames[frame][0] < cutoff:
+            result.staleFrames.append(frame)
+        if 0 == min(details[1] for details in fileDetails):
+            result.corruptFrames.append(frame)
+
+# ===================================================================
+def get_pass_extensions(renderData):
+# ===================================================================
+    # Returns a dictionary of pass name to the extension of its images, or
+    # None if an image format is not one whose extension is known
+    # ....................................................................
+    passExtensions = {}
+    for passName, template in get_output_templates(renderData):
+        imageFormat = renderData[c4d.RDATA_FORMAT] if '' == passName else renderData[c4d.RDATA_MULTIPASS_SAVEFORMAT]
+        if imageFormat not in IMAGE_EXTENSIONS:
+            return None
+        passExtensions[passName] = IMAGE_EXTENSIONS[imageFormat]
+
+    return passExtensions
+
+# ===================================================================
+def stat_expected_files(expectedFiles, passExtensions, frames, cutoff=None):
+# ===================================================================
+    # Checks the expected images of the frames one by one, rather than
+    # listing their folders, which is quicker when the frames are few and
+    # the folders large.  The pass extensions are those of
+    # get_pass_extensions, or blank where the names carry no extension
+    # ......................................................................
+    result = rb_scan_output.ScanResult(None, None, cutoff)
+    result.expectedFrames = frames
+    result.passFrames = {}
+    for folder, folderFiles in expectedFiles.items():
+        for name, (frame, passName) in folderFiles.items():
+            passFiles = result.passFrames.setdefault(passName, {})
+            extension = passExtensions.get(passName, '')
+            # The extension may have been written in capitals
+            for fileName in sorted(set([name + extension, name + extension.upper()])):
+                try:
+                    stat = os.stat(os.path.join(folder, fileName))
+                except OSError:
+                    continue
+                result.filesScanned += 1
+                passFiles[frame] = (stat.st_mtime, stat.st_size)
+                break
+
+    combine_pass_frames(result, frames, cutoff)
+
+    return result
+
+# ===================================================================
+def scan_expected_output(frames, cutoff=None, doc=None, renderData=None, take=None, progress=None):
+# ===================================================================
+    # Predicts the images of the frames and checks which of them exist.
+    # The document and render data default to the active ones and the take
+    # to the main take, which is the one rendered for a job of no take
+    # .................................................................
+    if doc is None:
+        doc = documents.GetActiveDocument()
+    if renderData is None:
+        renderData = doc.GetActiveRenderData()
+    take = rb_functions.get_job_take(doc, take)
+
+    expectedFiles, hasExtension = build_expected_files(doc, renderData, frames, take)
+
+    return match_expected_files(expectedFiles, hasExtension, frames, cutoff, progress)
@@ -0,0 +1,306 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+
+Description:
+    Renders frame ranges with a pool of Cinema 4D Commandline processes on
+    the local machine, as an alternative to rendering the marked takes one
+    after another in the interactive session.  The project is saved once
+    and each process renders a chunk of the ranges, e.g.
+
+        Commandline -nogui -render shot.c4d -frame 100 149 1 -threads 16
+
+    Set 'renderBackend' to 'pool' in the config file to switch it on.  The
+    executable, number of processes and threads per process may be set with
+    'commandlinePath', 'poolProcesses' and 'poolThreads', left blank they
+    are worked out from the Cinema 4D install and the number of cores.
+"""
+
+import os, sys, time, threading, subprocess
+import concurrent.futures
+import c4d
+from c4d import documents, storage
+import rb_functions, rb_scan_output
+
+config = rb_functions.get_config_values()
+debug = bool(int(config.get(rb_functions.CONFIG_SECTION, 'debug')))
+verbose = bool(int(config.get(rb_functions.CONFIG_SECTION, 'verbose')))
+
+BACKEND_TAKES = 'takes'
+BACKEND_POOL = 'pool'
+
+# Cores given to each process when the pool size is worked out
+CORES_PER_PROCESS = 16
+# Fewer frames than this in a chunk and loading the scene dominates
+MIN_CHUNK_FRAMES = 10
+
+# The output of each process is logged here, relative to the project folder
+POOL_LOG_FOLDER = 'power_ranger_logs'
+
+# ===================================================================
+class RenderChunk(object):
+# ===================================================================
+    """
+    One process worth of frames, [from, to] or [from, to, step], of a take.
+    A take name of None renders the take the project was saved with
+        returnCode: the exit code of the process, None until it has finished
+    """
+
+    def __init__(self, takeName, rangelet):
+        self.takeName = takeName
+        self.rangelet = rangelet
+        self.returnCode = None
+        self.duration = 0.0
+        self.logPath = None
+
+# ===================================================================
+def is_pool_backend():
+# ===================================================================
+    backend = rb_functions.get_config_values().get(rb_functions.CONFIG_RANGER_SECTION, 'renderBackend', fallback='').strip().lower()
+    if backend not in ['', BACKEND_TAKES, BACKEND_POOL]:
+        print("WARNING: ignoring render backend '" + backend + "', expected '" + BACKEND_TAKES + "' or '" + BACKEND_POOL + "'")
+
+    return BACKEND_POOL == backend
+
+# ===================================================================
+def find_commandline_executable():
+# ===================================================================
+    # Returns the Commandline executable installed alongside Cinema 4D
+    # .................................................................
+    installFolder = os.path.dirname(storage.GeGetStartupApplication())
+    if sys.platform.startswith('win'):
+        return os.path.join(installFolder, 'Commandline.exe')
+    if 'darwin' == sys.platform:
+        return os.path.join(installFolder, 'Commandline.app', 'Contents', 'MacOS', 'Commandline')
+
+    return os.path.join(installFolder, 'Commandline')
+
+# ===================================================================
+def get_pool_settings(cores=None):
+# ===================================================================
+    # Returns the executable, number of processes and threads per process.
+    # A blank or zero entry in the config file is worked out from the
+    # number of cores, so that together the processes use all of them
+    # .....................................................................
+    config = rb_functions.get_config_values()
+    executable = config.get(rb_functions.CONFIG_RANGER_SECTION, 'commandlinePath', fallback='').strip()
+    if '' == executable:
+        executable = find_commandline_executable()
+
+    processesStr = config.get(rb_functions.CONFIG_RANGER_SECTION, 'poolProcesses', fallback='').strip()
+    threadsStr = config.get(rb_functions.CONFIG_RANGER_SECTION, 'poolThreads', fallback='').strip()
+    processes = int(processesStr) if processesStr.isnumeric() else 0
+    threads = int(threadsStr) if threadsStr.isnumeric() else 0
+
+    if cores is None:
+        cores = os.cpu_count() or 1
+    if 0 >= processes:
+        processes = max(1, cores // (threads if 0 < threads else CORES_PER_PROCESS))
+    if 0 >= threads:
+        threads = max(1, cores // processes)
+
+    return executable, processes, threads
+
+# ===================================================================
+def split_render_chunks(takeJobs, processes, minChunkFrames=MIN_CHUNK_FRAMES):
+# ===================================================================
+    # Splits the rangelets of each (take name, array of rangelets) job into
+    # chunks of about an equal share of all the frames for each process, so
+    # that none sit idle, but no smaller than the minimum.  A stepped
+    # rangelet keeps its step in each of its chunks
+    # .....................................................................
+    totalFrames = sum(rb_functions.count_frames(rangeArray) for takeName, rangeArray in takeJobs)
+    chunkFrames = max(minChunkFrames, -(-totalFrames // max(1, processes)))
+
+    chunks = []
+    for takeName, rangeArray in takeJobs:
+        for elem in rangeArray:
+            frameFrom, frameTo = int(elem[0]), int(elem[1])
+            step = int(elem[2]) if True == rb_functions.isSteppedRangelet(elem) else 1
+            while frameFrom <= frameTo:
+                chunkTo = min(frameTo, frameFrom + (chunkFrames - 1) * step)
+                rangelet = [frameFrom, chunkTo] if 1 == step else rb_functions.make_stepped_rangelet(frameFrom, chunkTo, step)
+                chunks.append(RenderChunk(takeName, rangelet))
+                frameFrom = chunkTo + step
+
+    return chunks
+
+# ===================================================================
+def build_render_command(executable, projectFullPath, chunk, threads):
+# ===================================================================
+    # Returns the argument list which renders the chunk
+    # .................................................
+    step = int(chunk.rangelet[2]) if True == rb_functions.isSteppedRangelet(chunk.rangelet) else 1
+    command = [executable, '-nogui', '-render', projectFullPath,
+               '-frame', str(int(chunk.rangelet[0])), str(int(chunk.rangelet[1])), str(step),
+               '-threads', str(threads)]
+    if chunk.takeName is not None:
+        command += ['-take', chunk.takeName]
+
+    return command
+
+# ===================================================================
+class RenderPool(object):
+# ===================================================================
+    """
+    Runs the chunks with no more than the given number of processes at a
+    time.  The processes are started and waited on by background threads,
+    which never touch the Cinema 4D API, so the dialog polls for progress
+    and the exit code of each chunk
+    """
+
+    def __init__(self, executable, projectFullPath, chunks, processes, threads, logFolder=None):
+        self.executable = executable
+        self.projectFullPath = projectFullPath
+        self.chunks = chunks
+        self.processes = processes
+        self.threads = threads
+        self.logFolder = logFolder
+        self.lock = threading.Lock()
+        self.cancelEvent = threading.Event()
+        self.running = {}
+        self.executor = None
+        self.futures = []
+        self.startTime = None
+        self.duration = 0.0
+        self.error = None
+        # Passed back to whoever finishes the pool, such as journal ids
+        self.jobIds = []
+        self.framesSubmitted = 0
+
+    # ===================================================================
+    def start(self):
+    # ===================================================================
+        if False == os.path.isfile(self.executable):
+            raise RuntimeError("The render executable does not exist: " + self.executable)
+        if self.logFolder is not None:
+            os.makedirs(self.logFolder, exist_ok=True)
+
+        self.startTime = time.perf_counter()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.processes)
+        self.futures = [self.executor.submit(self.runChunk, idx, chunk) for idx, chunk in enumerate(self.chunks)]
+        # Nothing more will be submitted, the threads finish with the last chunk
+        self.executor.shutdown(wait=False)
+
+        print("Rendering " + str(len(self.chunks)) + " chunks with " + str(self.processes) +
+              " processes of " + str(self.threads) + " threads")
+
+    # ===================================================================
+    def runChunk(self, idx, chunk):
+    # ===================================================================
+        # Runs the process for one chunk and records its exit code
+        if self.cancelEvent.is_set():
+            return
+
+        command = build_render_command(self.executable, self.projectFullPath, chunk, self.threads)
+        if True == verbose:
+            print("Starting: " + ' '.join(command))
+
+        logFile = subprocess.DEVNULL
+        if self.logFolder is not None:
+            chunk.logPath = os.path.join(self.logFolder, 'chunk_' + str(idx).zfill(4) + '.log')
+            logFile = open(chunk.logPath, 'w')
+
+        chunkStart = time.perf_counter()
+        try:
+            with self.lock:
+                if self.cancelEvent.is_set():
+                    return
+                process = subprocess.Popen(command, stdout=logFile, stderr=subprocess.STDOUT)
+                self.running[idx] = process
+
+            chunk.returnCode = process.wait()
+
+        except Exception as e:
+            print("Error running render chunk " + str(chunk.rangelet) + ": " + str(e))
+            chunk.returnCode = -1
+
+        finally:
+            chunk.duration = time.perf_counter() - chunkStart
+            with self.lock:
+                self.running.pop(idx, None)
+            if logFile is not subprocess.DEVNULL:
+                logFile.close()
+
+        if 0 != chunk.returnCode:
+            print("WARNING: render chunk " + str(chunk.rangelet) + " exited with code " + str(chunk.returnCode))
+
+    # ===================================================================
+    def getCounts(self):
+    # ===================================================================
+        # Returns chunks finished, chunks running and chunks which failed
+        with self.lock:
+            running = len(self.running)
+        finished = [chunk for chunk in self.chunks if chunk.returnCode is not None]
+
+        return len(finished), running, len([chunk for chunk in finished if 0 != chunk.returnCode])
+
+    # ===================================================================
+    def isFinished(self):
+    # ===================================================================
+        finished = all(future.done() for future in self.futures)
+        if True == finished and self.startTime is not None and 0.0 == self.duration:
+            self.duration = time.perf_counter() - self.startTime
+
+        return finished
+
+    # ===================================================================
+    def wait(self):
+    # ===================================================================
+        concurrent.futures.wait(self.futures)
+        return self.isFinished()
+
+    # ===================================================================
+    def cancel(self):
+    # ===================================================================
+        # Stops the chunks still waiting and terminates those running
+        self.cancelEvent.set()
+        with self.lock:
+            for process in self.running.values():
+                process.terminate()
+
+    # ===================================================================
+    def isCancelled(self):
+    # ===================================================================
+        return self.cancelEvent.is_set()
+
+    # ===================================================================
+    def getFailedChunks(self):
+    # ===================================================================
+        # Chunks which exited with an error, or never ran as the pool was cancelled
+        return [chunk for chunk in self.chunks if 0 != chunk.returnCode]
+
+# ===================================================================
+def prepare_render_pool(takeJobs, doc=None):
+# ===================================================================
+    # Saves the project, so that the processes render what is in the
+    # session, and returns a render pool for the (take name, array of
+    # rangelets) jobs, ready to be started.  The stale cutoff from before
+    # the save is kept, so frames rendered earlier do not turn stale.
+    # Uses the Cinema 4D API, so must run on the main thread
+    # ...................................................................
+    if doc is None:
+        doc = documents.GetActiveDocument()
+
+    projectFullPath = rb_functions.get_projectFullPath()
+    if '' == projectFullPath:
+        raise RuntimeError("The project must be saved before it can be rendered by the render pool")
+
+    cutoff = rb_scan_output.get_staleCutoff()
+    if False == documents.SaveDocument(doc, projectFullPath, c4d.SAVEDOCUMENTFLAGS_DONTADDTORECENTLIST, c4d.FORMAT_C4DEXPORT):
+        raise RuntimeError("Failed to save the project to " + projectFullPath)
+    if cutoff is not None:
+        rb_scan_output.record_render_save(projectFullPath, cutoff)
+
+    executable, processes, threads = get_pool_settings()
+    chunks = split_render_chunks(takeJobs, processes)
+    # No point in more processes than there are chunks, share out their threads
+    if len(chunks) < processes:
+        threads = max(threads, (processes * threads) // max(1, len(chunks)))
+        processes = max(1, len(chunks))
+
+    renderPool = RenderPool(executable, projectFullPath, chunks, processes, threads, os.path.join(doc.GetDocumentPath(), POOL_LOG_FOLDER))
+    renderPool.framesSubmitted = sum(rb_functions.count_frames(rangeArray) for takeName, rangeArray in takeJobs)
+
+    return renderPool
@@ -0,0 +1,342 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+"""
+
+import os, json, time, threading
+import rb_functions
+
+config = rb_functions.get_config_values()
+debug = bool(int(config.get(rb_functions.CONFIG_SECTION, 'debug')))
+verbose = bool(int(config.get(rb_functions.CONFIG_SECTION, 'verbose')))
+
+STALE_CUTOFF_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d']
+# Saves made only so that the project can be rendered, see record_render_save
+RENDER_SAVES_FILE = rb_functions.__root__ + '/config/render_saves.json'
+
+# Number of directory entries between progress reports
+SCAN_CHUNK = 500
+
+# ===================================================================
+class ScanCancelled(Exception):
+# ===================================================================
+    """ Raised inside a scan when it has been cancelled """
+    pass
+
+# ===================================================================
+class ScanProgress(object):
+# ===================================================================
+    """
+    Shared between a scan running in the background and the dialog.
+    The scan reports its counts after each chunk of directory entries and
+    checks for cancellation after every entry.  The dialog reads the
+    counts and picks up the result, or error, when the scan has finished
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancelEvent = threading.Event()
+        self.filesScanned = 0
+        self.framesFound = 0
+        self.gapsFound = 0
+        self.finished = False
+        self.result = None
+        self.error = None
+        self.duration = 0.0
+
+    # ===================================================================
+    def update(self, filesScanned, framesFound, gapsFound):
+    # ===================================================================
+        with self.lock:
+            self.filesScanned = filesScanned
+            self.framesFound = framesFound
+            self.gapsFound = gapsFound
+
+    # ===================================================================
+    def getCounts(self):
+    # ===================================================================
+        # Returns files scanned, frames found and gaps so far
+        with self.lock:
+            return self.filesScanned, self.framesFound, self.gapsFound
+
+    # ===================================================================
+    def finish(self, result, error=None):
+    # ===================================================================
+        with self.lock:
+            self.result = result
+            self.error = error
+            self.finished = True
+
+    # ===================================================================
+    def isFinished(self):
+    # ===================================================================
+        with self.lock:
+            return self.finished
+
+    # ===================================================================
+    def cancel(self):
+    # ===================================================================
+        self.cancelEvent.set()
+
+    # ===================================================================
+    def isCancelled(self):
+    # ===================================================================
+        return self.cancelEvent.is_set()
+
+    # ===================================================================
+    def checkCancelled(self):
+    # ===================================================================
+        if self.cancelEvent.is_set():
+            raise ScanCancelled("The scan was cancelled")
+
+    # ===================================================================
+    def run(self, scanJob):
+    # ===================================================================
+        # Runs the scan job, passing it this progress, and records the outcome
+        startTime = time.perf_counter()
+        try:
+            result = scanJob(self)
+            self.duration = time.perf_counter() - startTime
+            self.finish(result)
+        except ScanCancelled as e:
+            self.finish(None, str(e))
+        except Exception as e:
+            self.finish(None, "Error scanning the output folder. Error message: " + str(e))
+
+# ===================================================================
+class ScanResult(object):
+# ===================================================================
+    """
+    The outcome of a single pass over an output folder
+        frames: dictionary of frame number to (mtime, size) of the rendered file
+        passFrames: dictionary of pass name to its own dictionary of frames
+        staleFrames: frames whose file is older than the cutoff time
+        corruptFrames: frames with an empty image file, e.g. from an interrupted save
+        expectedFrames: the frames looked for, when the files were predicted
+        missingFrames: frames expected but not found, when the files were predicted
+        window: the (from, to, step) frames within which gaps are looked for
+        framesOutsideWindow: count of images ignored as outside the window
+    """
+
+    def __init__(self, savePath, filePrefix, cutoff=None):
+        self.savePath = savePath
+        self.filePrefix = filePrefix
+        self.cutoff = cutoff
+        self.seqLen = -1
+        self.filesScanned = 0
+        self.frames = {}
+        self.passFrames = {'': self.frames}
+        self.staleFrames = []
+        self.corruptFrames = []
+        self.expectedFrames = None
+        self.missingFrames = []
+        self.window = None
+        self.framesOutsideWindow = 0
+
+    # ===================================================================
+    def getHighestSequence(self):
+    # ===================================================================
+        # Returns the highest sequence number found, padded as in the file name
+        if 0 >= self.seqLen:
+            return str(max(self.frames))
+        return rb_functions.getTestSequenceNumber(max(self.frames), self.seqLen)
+
+# ===================================================================
+def scan_output_folder(savePath, filePrefix, cutoff=None, progress=None, window=None):
+# ===================================================================
+    # Lists the output folder once, collecting the sequence number, modified
+    # time and size of each image which matches the file prefix.  Where a
+    # cutoff time is given, images modified before it are flagged as stale.
+    # Where a (from, to, step) window is given, images outside it, such as
+    # those of an earlier version of the range, are ignored.
+    # The directory entry supplies the file type, so the only stat call made
+    # is the one for a matching image, which yields both mtime and size.
+    # Progress, if given, is reported in chunks and cancellation checked
+    # after each entry.
+    # ......................................................................
+    result = ScanResult(savePath, filePrefix, cutoff)
+    result.window = window
+    firstFrame = 0 if window is None else window[0]
+    highestFrame = firstFrame - 1
+
+    with os.scandir(savePath) as entries:
+        for entry in entries:
+            result.filesScanned += 1
+            if progress is not None:
+                progress.checkCancelled()
+                if 0 == result.filesScanned % SCAN_CHUNK:
+                    # Gaps so far are those below the highest frame seen
+                    progress.update(result.filesScanned, len(result.frames), highestFrame + 1 - firstFrame - len(result.frames))
+
+            fileName = os.path.splitext(entry.name)[0]
+
+            # Ignore directories
+            if False == entry.is_file():
+                continue
+
+            # Special case where the file has no sequence number attached to it, ignore it
+            if fileName == filePrefix:
+                if True == debug:
+                    # Ignore image with no sequence number
+                    print("Ignoring image with no sequence number.")
+                continue
+
+            if False == fileName.startswith(filePrefix):
+                continue
+
+            dirSequenceNumberElem = rb_functions.getFileSequenceNumber(filePrefix, fileName)
+            if False == dirSequenceNumberElem.isnumeric():
+                if True == debug:
+                    # Ignore non-numeric elements
+                    print("Ignoring non-numeric sequence '" + dirSequenceNumberElem + "'.")
+                continue
+
+            frame = int(dirSequenceNumberElem)
+            if window is not None and (frame < window[0] or frame > window[1]):
+                result.framesOutsideWindow += 1
+                continue
+
+            # We must check that the sequence numbers of all the entries are all the same length
+            newLen = len(dirSequenceNumberElem)
+            if result.seqLen != -1 and newLen != result.seqLen:
+                raise RuntimeError("Multiple sequence lengths: " + str(result.seqLen) + " and " + str(newLen) + "\nFolder cannot be processed.")
+
+            result.seqLen = newLen
+            if frame in result.frames:
+                if True == debug:
+                    print("Ignoring duplicate sequence '" + dirSequenceNumberElem + "'.")
+                continue
+
+            stat = entry.stat()
+            result.frames[frame] = (stat.st_mtime, stat.st_size)
+            highestFrame = max(highestFrame, frame)
+            if cutoff is not None and stat.st_mtime < cutoff:
+                if True == verbose:
+                    print("Stale image: " + entry.name)
+                result.staleFrames.append(frame)
+            if 0 == stat.st_size:
+                result.corruptFrames.append(frame)
+
+    result.staleFrames.sort()
+    result.corruptFrames.sort()
+    if True == verbose and 0 < result.framesOutsideWindow:
+        print("Ignored " + str(result.framesOutsideWindow) + " images outside frames " + str(window[0]) + " to " + str(window[1]))
+    if progress is not None:
+        progress.update(result.filesScanned, len(result.frames), highestFrame + 1 - firstFrame - len(result.frames))
+
+    return result
+
+# ===================================================================
+def calc_missing_ranges(scanResult):
+# ===================================================================
+    # Returns the array of rangelets absent from the sequence.  With a window
+    # this runs from its first to its last frame, so frames missing after the
+    # last image are included, otherwise from zero up to the highest sequence
+    # number found.  The rangelets are built from the spaces between the
+    # rendered frames, so the cost depends on the number of images rather
+    # than the number of missing frames.  Where the files were predicted
+    # the missing frames are already known
+    # ......................................................................
+    if scanResult.expectedFrames is not None:
+        return rb_functions.frames_to_ranges(scanResult.missingFrames)
+
+    lastFrame = None
+    nextFrame = 0
+    if scanResult.window is not None:
+        nextFrame, lastFrame, step = scanResult.window
+        if 1 < step:
+            # Only every step'th frame is rendered, so look for each of them
+            return rb_functions.frames_to_ranges([frame for frame in get_window_frames(scanResult.window) if frame not in scanResult.frames])
+
+    rangeArray = []
+    for frame in sorted(scanResult.frames):
+        if frame > nextFrame:
+            rangeArray.append([nextFrame, frame - 1])
+        nextFrame = frame + 1
+
+    if lastFrame is not None and nextFrame <= lastFrame:
+        rangeArray.append([nextFrame, lastFrame])
+
+    return rangeArray
+
+# ===================================================================
+def get_gap_window(renderSettings):
+# ===================================================================
+    # Returns the (from, to, step) frames within which gaps are looked for.
+    # This is the frame range of the render settings, unless the
+    # 'gapRangeOverride' config entry gives one, e.g. 10001-12000 or 1-99:2
+    # .....................................................................
+    overrideStr = rb_functions.get_config_values().get(rb_functions.CONFIG_RANGER_SECTION, 'gapRangeOverride', fallback='').replace(' ', '')
+    if '' != overrideStr:
+        if False is not rb_functions.stateTransitionRangelet(overrideStr):
+            _, rangeArray = rb_functions.analyse_frame_ranges(overrideStr)
+            if 1 == len(rangeArray):
+                elem = rangeArray[0]
+                step = int(elem[2]) if True == rb_functions.isSteppedRangelet(elem) else 1
+                return int(elem[0]), int(elem[1]), step
+        print("WARNING: ignoring gap range override '" + overrideStr + "', expected a single range such as 10001-12000")
+
+    return renderSettings[rb_functions.RANGE_FROM], renderSettings[rb_functions.RANGE_TO], max(1, renderSettings[rb_functions.RANGE_STEP])
+
+# ===================================================================
+def get_window_frames(window):
+# ===================================================================
+    # Returns the list of frames rendered within the (from, to, step) window
+    # ......................................................................
+    return list(range(window[0], window[1] + 1, window[2]))
+
+# ===================================================================
+def read_render_saves():
+# ===================================================================
+    if False == os.path.isfile(RENDER_SAVES_FILE):
+        return {}
+    try:
+        with open(RENDER_SAVES_FILE, 'r') as savesFile:
+            return json.load(savesFile)
+    except ValueError:
+        print("WARNING: ignoring unreadable render saves file " + RENDER_SAVES_FILE)
+        return {}
+
+# ===================================================================
+def record_render_save(projectFullPath, cutoff):
+# ===================================================================
+    # Records that the project file was saved for a render, along with the
+    # stale cutoff from before the save.  So long as the file is not saved
+    # again the cutoff is kept, rather than taking the save as a change
+    # ......................................................................
+    renderSaves = read_render_saves()
+    renderSaves[projectFullPath] = {'modified': os.path.getmtime(projectFullPath), 'cutoff': cutoff}
+    tempFile = RENDER_SAVES_FILE + '.tmp'
+    with open(tempFile, 'w') as savesFile:
+        json.dump(renderSaves, savesFile)
+    os.replace(tempFile, RENDER_SAVES_FILE)
+
+# ===================================================================
+def get_staleCutoff():
+# ===================================================================
+    # Returns the time before which rendered images are considered stale.
+    # This is the user supplied 'staleCutoff' config entry if there is one,
+    # otherwise the modified time of the project file, or the cutoff from
+    # before the project was last saved for a render.  None means the stale
+    # check is not possible
+    # .....................................................................
+    cutoffStr = rb_functions.get_config_values().get(rb_functions.CONFIG_RANGER_SECTION, 'staleCutoff', fallback='').strip()
+    if '' != cutoffStr:
+        for cutoffFormat in STALE_CUTOFF_FORMATS:
+            try:
+                return time.mktime(time.strptime(cutoffStr, cutoffFormat))
+            except ValueError:
+                continue
+        print("WARNING: ignoring stale cutoff '" + cutoffStr + "', expected the format YYYY-MM-DD HH:MM:SS")
+
+    projectFullPath = rb_functions.get_projectFullPath()
+    if '' == projectFullPath or False == os.path.isfile(projectFullPath):
+        return None
+
+    modified = os.path.getmtime(projectFullPath)
+    renderSave = read_render_saves().get(projectFullPath)
+    if renderSave is not None and modified == renderSave['modified']:
+        return renderSave['cutoff']
+
+    return modified
@@ -0,0 +1,238 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+
+Description:
+    Finds runs of frames whose animation is identical, such as holds, so
+    that only the first frame of each run is rendered.  The images of the
+    other frames are hard linked, or copied, from it once it has rendered.
+
+    A frame's state is the value of every animation curve in the document
+    at that frame.  Anything animated without keys, such as simulations,
+    Xpresso, image sequence textures or animated shaders, is not seen, so
+    this is switched on per project by setting 'staticFrameLinking' to 1
+    in the config file.
+"""
+
+import os, json, shutil, hashlib
+import c4d
+from c4d import documents
+import rb_functions, rb_animation_diff, rb_path_predict, rb_job_journal
+
+config = rb_functions.get_config_values()
+debug = bool(int(config.get(rb_functions.CONFIG_SECTION, 'debug')))
+verbose = bool(int(config.get(rb_functions.CONFIG_SECTION, 'verbose')))
+
+# ===================================================================
+def is_static_linking_enabled():
+# ===================================================================
+    linkingStr = rb_functions.get_config_values().get(rb_functions.CONFIG_RANGER_SECTION, 'staticFrameLinking', fallback='').strip()
+
+    return '1' == linkingStr
+
+# ===================================================================
+def get_animated_curves(doc):
+# ===================================================================
+    # Returns the curves of every track which can change over time.  A
+    # curve with fewer than two keys holds the one value throughout
+    # ..................................................................
+    curves = []
+    for nodePath, node in rb_animation_diff.iterate_animated_nodes(doc):
+        for track in node.GetCTracks():
+            curve = track.GetCurve()
+            if curve is not None and 1 < curve.GetKeyCount():
+                curves.append(curve)
+
+    return curves
+
+# ===================================================================
+def hash_frame_states(doc, frames):
+# ===================================================================
+    # Returns a dictionary of frame to a digest of the values of all the
+    # animated curves at that frame
+    # ..................................................................
+    fps = doc.GetFps()
+    curves = get_animated_curves(doc)
+    if True == verbose:
+        print("Hashing " + str(len(curves)) + " animated curves over " + str(len(frames)) + " frames")
+
+    frameStates = {}
+    for frame in frames:
+        frameTime = c4d.BaseTime(frame, fps)
+        values = [curve.GetValue(frameTime) for curve in curves]
+        frameStates[frame] = hashlib.md5(json.dumps(values).encode('utf-8')).hexdigest()
+
+    return frameStates
+
+# ===================================================================
+def find_static_runs(frames, frameStates):
+# ===================================================================
+    # Returns the runs of two or more consecutive frames with the same
+    # state, each as a list of frames.  The frames must be in order
+    # ................................................................
+    runs = []
+    run = []
+    for frame in frames:
+        if 0 < len(run) and frame == run[-1] + 1 and frameStates[frame] == frameStates[run[-1]]:
+            run.append(frame)
+            continue
+        if 1 < len(run):
+            runs.append(run)
+        run = [frame]
+
+    if 1 < len(run):
+        runs.append(run)
+
+    return runs
+
+# ===================================================================
+def build_link_plan(doc, renderData, take, runs):
+# ===================================================================
+    # Works out the expected image names of the first frame of each run and
+    # of the frames it stands in for, pass by pass.  Returns a list with an
+    # entry for each output folder, holding [source name, target name] pairs
+    # ......................................................................
+    folderPlans = {}
+    for run in runs:
+        expectedFiles, hasExtension = rb_path_predict.build_expected_files(doc, renderData, run, take)
+        for folder, folderFiles in expectedFiles.items():
+            # Expected name of each frame and pass
+            names = {}
+            for name, (frame, passName) in folderFiles.items():
+                names[(frame, passName)] = name
+
+            folderPlan = folderPlans.setdefault(folder, {'folder': folder, 'hasExtension': hasExtension, 'links': []})
+            folderPlan['links'] += [[names[(run[0], passName)], name] for (frame, passName), name in names.items() if frame != run[0]]
+
+    return list(folderPlans.values())
+
+# ===================================================================
+def plan_static_frames(takeJobs, doc=None):
+# ===================================================================
+    # Takes the (source take, render data, array of rangelets) jobs of a
+    # submission and finds the runs of identical frames within them.
+    # Returns the jobs with only the first frame of each run left to be
+    # rendered, the link plan for the rest and the number of frames linked.
+    # Stepped rangelets are rendered as they are.  Uses the Cinema 4D API,
+    # so must run on the main thread
+    # .....................................................................
+    if doc is None:
+        doc = documents.GetActiveDocument()
+
+    plannedJobs = []
+    linkPlan = []
+    framesLinked = 0
+    for sourceTake, sourceRenderData, rangeArray in takeJobs:
+        frames = []
+        keptArray = []
+        for elem in rangeArray:
+            if True == rb_functions.isSteppedRangelet(elem):
+                keptArray.append(elem)
+            else:
+                frames.extend(range(int(elem[0]), int(elem[1]) + 1))
+
+        runs = find_static_runs(frames, hash_frame_states(doc, frames))
+        if 0 >= len(runs):
+            plannedJobs.append((sourceTake, sourceRenderData, rangeArray))
+            continue
+
+        renderData = sourceRenderData if sourceRenderData is not None else doc.GetActiveRenderData()
+        take = rb_functions.get_job_take(doc, sourceTake)
+        linkPlan += build_link_plan(doc, renderData, take, runs)
+
+        linkedFrames = set()
+        for run in runs:
+            linkedFrames.update(run[1:])
+        framesLinked += len(linkedFrames)
+
+        renderFrames = [frame for frame in frames if frame not in linkedFrames]
+        _, plannedArray = rb_functions.normalise_frame_ranges(rb_functions.compress_frame_ranges(
+            rb_functions.frames_to_ranges(renderFrames)) + keptArray)
+        plannedJobs.append((sourceTake, sourceRenderData, plannedArray))
+
+    if True == debug:
+        print(str(framesLinked) + " frames are identical to the frame before them and will be linked")
+
+    return plannedJobs, linkPlan, framesLinked
+
+# ===================================================================
+def link_image(sourceFullPath, targetFullPath):
+# ===================================================================
+    # Hard links the image, falling back to a copy where the file system
+    # does not support links.  An existing target is replaced
+    # ..................................................................
+    tempFullPath = targetFullPath + '.link'
+    try:
+        os.link(sourceFullPath, tempFullPath)
+    except OSError:
+        shutil.copy2(sourceFullPath, tempFullPath)
+    os.replace(tempFullPath, targetFullPath)
+
+# ===================================================================
+def apply_link_plans(projectFullPath, expirePlans=True):
+# ===================================================================
+    # Links the images of each pending plan whose source frames have been
+    # rendered since they were submitted.  Each output folder is listed
+    # once per plan.  Images which were written after the submission are
+    # left alone.  Plans with every image in place are resolved, as are
+    # plans whose jobs have all finished, if expiring, since the source
+    # frames left will not now be rendered.  Returns the number of images
+    # linked
+    # .....................................................................
+    imagesLinked = 0
+    resolvedIds = []
+    finishedJobIds = rb_job_journal.get_finished_job_ids() if True == expirePlans else set()
+    for plan in rb_job_journal.get_pending_link_plans(projectFullPath):
+        # Plans from before their jobs were recorded go by when they were made
+        planTime = plan.get('submitted', plan['time'])
+        planDone = True
+        linksLeft = 0
+        for folderPlan in plan['folders']:
+            folder = folderPlan['folder']
+            if False == os.path.isdir(folder):
+                planDone = False
+                linksLeft += len(folderPlan['links'])
+                continue
+
+            # File names in the folder, keyed as the expected names are
+            files = {}
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        key = os.path.splitext(entry.name)[0] if True == folderPlan['hasExtension'] else entry.name
+                        files[key] = entry
+
+            for sourceName, targetName in folderPlan['links']:
+                source = files.get(sourceName)
+                if source is None or 0 >= source.stat().st_size or source.stat().st_mtime < planTime:
+                    # Not yet rendered, or not yet rendered again
+                    planDone = False
+                    linksLeft += 1
+                    continue
+
+                target = files.get(targetName)
+                if target is not None and (target.stat().st_mtime >= planTime or target.inode() == source.inode()):
+                    continue
+
+                targetFileName = targetName + os.path.splitext(source.name)[1] if True == folderPlan['hasExtension'] else targetName
+                try:
+                    link_image(source.path, os.path.join(folder, targetFileName))
+                    imagesLinked += 1
+                except OSError as e:
+                    print("WARNING: unable to link " + source.name + " to " + targetFileName + ": " + str(e))
+                    planDone = False
+                    linksLeft += 1
+
+        if True == planDone:
+            resolvedIds.append(plan['jobId'])
+        elif 0 < len(plan.get('jobIds', [])) and all(jobId in finishedJobIds for jobId in plan['jobIds']):
+            print("WARNING: " + str(linksLeft) + " images of identical frames were not linked, their first frame did not render")
+            resolvedIds.append(plan['jobId'])
+
+    if 0 < len(resolvedIds):
+        rb_job_journal.record_resolution(resolvedIds)
+    if 0 < imagesLinked:
+        print("Linked " + str(imagesLinked) + " images of identical frames")
+
+    return imagesLinked
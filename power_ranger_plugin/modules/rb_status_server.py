@@ -0,0 +1,171 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+
+Description:
+    Serves the render status of the active project as JSON over HTTP, so
+    that progress can be checked without asking the artist, e.g.
+
+        curl http://127.0.0.1:8765/status
+
+    The server only listens on the local machine and is switched on by
+    setting 'statusPort' in the config file.  Requests are answered from a
+    snapshot which the plugin updates after each scan and submission, so a
+    request never scans the file system or touches the Cinema 4D API.
+"""
+
+import json, time, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from c4d import documents
+import rb_functions, rb_scan_output
+
+config = rb_functions.get_config_values()
+debug = bool(int(config.get(rb_functions.CONFIG_SECTION, 'debug')))
+verbose = bool(int(config.get(rb_functions.CONFIG_SECTION, 'verbose')))
+
+STATUS_HOST = '127.0.0.1'
+STATUS_PATHS = ['/', '/status']
+
+# Sections of the snapshot
+SECTION_SCAN = 'scan'
+SECTION_SCAN_PROGRESS = 'scanProgress'
+SECTION_SUBMISSION = 'submission'
+SECTION_METRICS = 'metrics'
+
+_statusLock = threading.Lock()
+_statusSnapshot = {'updated': None}
+# The snapshot is encoded once per update, not once per request
+_statusBody = json.dumps(_statusSnapshot).encode('utf-8')
+_statusServer = None
+
+# ===================================================================
+def update_status(section, fields):
+# ===================================================================
+    # Replaces one section of the status snapshot.  Called on the main
+    # thread, so this is also where the project name is picked up
+    # .................................................................
+    global _statusBody
+    doc = documents.GetActiveDocument()
+    projectName = '' if doc is None else doc.GetDocumentName()
+    with _statusLock:
+        _statusSnapshot['project'] = projectName
+        _statusSnapshot['updated'] = round(time.time(), 3)
+        _statusSnapshot[section] = fields
+        _statusBody = json.dumps(_statusSnapshot).encode('utf-8')
+
+# ===================================================================
+def update_metrics_status(kind, record):
+# ===================================================================
+    # Keeps the latest metrics record of each kind in the snapshot
+    # ..............................................................
+    with _statusLock:
+        metrics = dict(_statusSnapshot.get(SECTION_METRICS, {}))
+    metrics[kind] = record
+    update_status(SECTION_METRICS, metrics)
+
+# ===================================================================
+def update_scan_status(scanResults):
+# ===================================================================
+    # Summarises the results of a gap scan, one entry per output folder
+    # .................................................................
+    folders = []
+    for scanResult in scanResults:
+        missingRangeArray = rb_scan_output.calc_missing_ranges(scanResult)
+        folders.append({
+            'savePath': scanResult.savePath,
+            'filePrefix': scanResult.filePrefix,
+            'frameRange': None if scanResult.window is None else [scanResult.window[0], scanResult.window[1]],
+            'framesFound': len(scanResult.frames),
+            'missingCount': rb_functions.count_frames(missingRangeArray),
+            'missing': rb_functions.format_frame_ranges(rb_functions.compress_frame_ranges(missingRangeArray)),
+            'staleCount': len(scanResult.staleFrames),
+            'corruptCount': len(scanResult.corruptFrames)
+        })
+
+    update_status(SECTION_SCAN, {
+        'finished': round(time.time(), 3),
+        'missingCount': sum(folder['missingCount'] for folder in folders),
+        'folders': folders
+    })
+
+# ===================================================================
+def get_status_body():
+# ===================================================================
+    with _statusLock:
+        return _statusBody
+
+# ===================================================================
+class StatusRequestHandler(BaseHTTPRequestHandler):
+# ===================================================================
+    """
+    Answers GET requests with the current status snapshot
+    """
+
+    # ===================================================================
+    def do_GET(self):
+    # ===================================================================
+        if self.path.split('?')[0] not in STATUS_PATHS:
+            self.send_error(404, "Unknown status path")
+            return
+
+        body = get_status_body()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    # ===================================================================
+    def log_message(self, format, *args):
+    # ===================================================================
+        # Requests are only logged to the console when debugging
+        if True == debug:
+            print("Status request: " + (format % args))
+
+# ===================================================================
+def get_status_port():
+# ===================================================================
+    # Returns the port from the config file, 0 means the server is off
+    # ................................................................
+    portStr = rb_functions.get_config_values().get(rb_functions.CONFIG_RANGER_SECTION, 'statusPort', fallback='').strip()
+    if '' == portStr:
+        return 0
+    if False == portStr.isnumeric() or 65535 < int(portStr):
+        print("WARNING: ignoring status port '" + portStr + "', expected a number up to 65535")
+        return 0
+
+    return int(portStr)
+
+# ===================================================================
+def start_status_server(port=None):
+# ===================================================================
+    # Starts the status server on a background thread, if it is switched
+    # on and not already running.  Returns the server, or None
+    # ...................................................................
+    global _statusServer
+    if _statusServer is not None:
+        return _statusServer
+
+    if port is None:
+        port = get_status_port()
+    if 0 >= port:
+        return None
+
+    _statusServer = ThreadingHTTPServer((STATUS_HOST, port), StatusRequestHandler)
+    _statusServer.daemon_threads = True
+    serverThread = threading.Thread(target=_statusServer.serve_forever, name='PowerRangerStatus', daemon=True)
+    serverThread.start()
+    print("* Power Ranger status available at http://" + STATUS_HOST + ":" + str(_statusServer.server_address[1]) + "/status")
+
+    return _statusServer
+
+# ===================================================================
+def stop_status_server():
+# ===================================================================
+    global _statusServer
+    if _statusServer is not None:
+        _statusServer.shutdown()
+        _statusServer.server_close()
+        _statusServer = None
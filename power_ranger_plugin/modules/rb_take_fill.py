@@ -0,0 +1,124 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+
+Description:
+    Finds the missing frames of every checked take in the document, each
+    with its own render data and output path, so that all of the gaps can
+    be filled with a single render submission.
+"""
+
+import concurrent.futures
+from c4d import documents
+import rb_functions, rb_scan_output, rb_path_predict
+
+config = rb_functions.get_config_values()
+debug = bool(int(config.get(rb_functions.CONFIG_SECTION, 'debug')))
+verbose = bool(int(config.get(rb_functions.CONFIG_SECTION, 'verbose')))
+
+# Seconds between progress reports while the takes are being scanned
+TAKE_SCAN_POLL = 0.1
+
+# ===================================================================
+class TakeScan(object):
+# ===================================================================
+    """
+    Everything needed to scan the output of one take, resolved on the main thread
+    """
+
+    def __init__(self, take, renderData, frames, expectedFiles, hasExtension):
+        self.take = take
+        self.renderData = renderData
+        self.frames = frames
+        self.expectedFiles = expectedFiles
+        self.hasExtension = hasExtension
+
+# ===================================================================
+def get_checked_takes(takeData):
+# ===================================================================
+    # Returns the takes which are marked for rendering
+    # ................................................
+    return [take for take in rb_functions.iterate_takes(takeData) if take.IsChecked()]
+
+# ===================================================================
+def prepare_take_scans(doc=None):
+# ===================================================================
+    # Resolves the effective render data of each checked take and predicts
+    # the images it should have produced over its own frame range, or the
+    # gap range override if there is one.  This uses the Cinema 4D API, so
+    # must run on the main thread
+    # ....................................................................
+    if doc is None:
+        doc = documents.GetActiveDocument()
+
+    takeData = doc.GetTakeData()
+    if takeData is None:
+        raise RuntimeError("Failed to retrieve the take data")
+
+    takeScans = []
+    for take in get_checked_takes(takeData):
+        renderData, _ = take.GetEffectiveRenderData(takeData)
+        if renderData is None:
+            renderData = doc.GetActiveRenderData()
+
+        renderSettings = rb_functions.get_renderData_settings(renderData)
+        frames = rb_scan_output.get_window_frames(rb_scan_output.get_gap_window(renderSettings))
+        expectedFiles, hasExtension = rb_path_predict.build_expected_files(doc, renderData, frames, take)
+        if True == debug:
+            print("Take '" + take.GetName() + "' expects output in: " + ', '.join(expectedFiles))
+
+        takeScans.append(TakeScan(take, renderData, frames, expectedFiles, hasExtension))
+
+    return takeScans
+
+# ===================================================================
+def scan_take_outputs(takeScans, cutoff=None, progress=None, workers=None):
+# ===================================================================
+    # Scans the output folders of all the takes at the same time and
+    # returns the list of scan results, in the order of the takes.
+    # Each scan reports to its own progress, and these are added up
+    # for the overall progress, which also passes on cancellation
+    # ...............................................................
+    takeProgress = [rb_scan_output.ScanProgress() for takeScan in takeScans]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(rb_path_predict.match_expected_files,
+                            takeScan.expectedFiles, takeScan.hasExtension, takeScan.frames, cutoff, takeProgress[idx])
+            for idx, takeScan in enumerate(takeScans)
+        ]
+
+        pending = set(futures)
+        while 0 < len(pending):
+            _, pending = concurrent.futures.wait(pending, timeout=TAKE_SCAN_POLL)
+            if progress is None:
+                continue
+            if progress.isCancelled():
+                for eachProgress in takeProgress:
+                    eachProgress.cancel()
+            counts = [eachProgress.getCounts() for eachProgress in takeProgress]
+            progress.update(*[sum(count) for count in zip(*counts)])
+
+        # Raises any error, including cancellation, from the scans
+        return [future.result() for future in futures]
+
+# ===================================================================
+def calc_take_gap_jobs(takeScans, scanResults, includeStale=False):
+# ===================================================================
+    # Works out the rangelets to render for each take, returning a list of
+    # (take, render data, array of rangelets) ready for submission.  Takes
+    # with nothing to render are left out
+    # ....................................................................
+    takeJobs = []
+    for takeScan, scanResult in zip(takeScans, scanResults):
+        rangeArray = rb_scan_output.calc_missing_ranges(scanResult)
+        if True == includeStale:
+            rangeArray += rb_functions.frames_to_ranges(scanResult.staleFrames)
+        if 0 >= len(rangeArray):
+            continue
+
+        _, rangeArray = rb_functions.normalise_frame_ranges(rangeArray)
+        _, rangeArray = rb_functions.normalise_frame_ranges(rb_functions.compress_frame_ranges(rangeArray))
+        takeJobs.append((takeScan.take, takeScan.renderData, rangeArray))
+
+    return takeJobs
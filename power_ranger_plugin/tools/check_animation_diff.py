@@ -0,0 +1,119 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+
+Description:
+    Checks the animation snapshot and diff against a fake document: the
+    track keys, including those of nodes which share a name, the reuse of
+    untouched tracks and the frames worked out as changed.  The modules
+    import c4d, so run it with the Python that comes with Cinema 4D, e.g.
+
+        c4dpy check_animation_diff.py
+"""
+
+import os, sys
+
+toolsFolder = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(toolsFolder), 'modules'))
+
+import rb_animation_diff
+from fake_document import FakeDocument, FakeNode, FakeTrack
+
+# ===================================================================
+def make_document():
+# ===================================================================
+    # Two sibling Cubes, each with a Phong tag, the second Cube with two
+    # tags of the same name, a Sphere under the first and a material
+    # ..................................................................
+    return FakeDocument('shot.c4d', objects=[
+        FakeNode('Cube', tracks=[FakeTrack('Position . X', [(0, 0.0), (20, 5.0), (40, 5.0)])],
+                 children=[FakeNode('Sphere', tracks=[FakeTrack('Rotation . H', [(0, 0.0), (90, 1.0)])])],
+                 tags=[FakeNode('Phong', tracks=[FakeTrack('Angle', [(0, 0.5), (10, 0.7)])])]),
+        FakeNode('Cube', tracks=[FakeTrack('Position . X', [(0, 1.0), (60, 2.0)])],
+                 tags=[FakeNode('Phong'), FakeNode('Phong', tracks=[FakeTrack('Angle', [(5, 0.1), (15, 0.2)])])])
+    ], materials=[
+        FakeNode('Mat', tracks=[FakeTrack('Color . R', [(30, 0.0), (50, 1.0)])])
+    ])
+
+# ===================================================================
+def check_unique_keys():
+# ===================================================================
+    # Nodes which share a name each get a key of their own
+    # ....................................................
+    rb_animation_diff._trackCache.clear()
+    doc = make_document()
+    paths = [path for path, node in rb_animation_diff.iterate_animated_nodes(doc)]
+    assert ['obj:/Cube', 'obj:/Cube#Phong', 'obj:/Cube/Sphere', 'obj:/Cube[1]', 'obj:/Cube[1]#Phong',
+            'obj:/Cube[1]#Phong[1]', 'mat:/Mat'] == paths, paths
+
+    snapshot = rb_animation_diff.snapshot_tracks(doc)
+    assert sorted(['obj:/Cube|Position . X', 'obj:/Cube#Phong|Angle', 'obj:/Cube/Sphere|Rotation . H',
+                   'obj:/Cube[1]|Position . X', 'obj:/Cube[1]#Phong[1]|Angle', 'mat:/Mat|Color . R']) == sorted(snapshot)
+    assert [[0, 1.0, 0, 0.0, 0.0], [60, 2.0, 0, 0.0, 0.0]] == snapshot['obj:/Cube[1]|Position . X'][rb_animation_diff.SNAP_KEYS]
+
+# ===================================================================
+def check_incremental_snapshot():
+# ===================================================================
+    # Untouched tracks reuse the cached entry, a track whose keys were set
+    # again is hashed again
+    # .....................................................................
+    rb_animation_diff._trackCache.clear()
+    doc = make_document()
+    firstSnapshot = rb_animation_diff.snapshot_tracks(doc)
+    track = doc.GetFirstObject().GetNext().GetCTracks()[0]
+    track.setKeys([(0, 1.0), (30, 3.0), (60, 2.0)])
+    secondSnapshot = rb_animation_diff.snapshot_tracks(doc)
+
+    for trackKey in firstSnapshot:
+        if 'obj:/Cube[1]|Position . X' == trackKey:
+            assert firstSnapshot[trackKey] is not secondSnapshot[trackKey]
+            assert firstSnapshot[trackKey][rb_animation_diff.SNAP_DIGEST] != secondSnapshot[trackKey][rb_animation_diff.SNAP_DIGEST]
+        else:
+            assert firstSnapshot[trackKey] is secondSnapshot[trackKey]
+
+# ===================================================================
+def check_changed_interval():
+# ===================================================================
+    # A changed key affects the frames out to its neighbouring keys, a
+    # changed end key the frames out to the document range
+    # .................................................................
+    keys = [[0, 0.0, 0, 0.0, 0.0], [20, 5.0, 0, 0.0, 0.0], [40, 5.0, 0, 0.0, 0.0]]
+    assert None == rb_animation_diff.get_changedInterval(keys, keys, 0, 100)
+
+    moved = [keys[0], [20, 6.0, 0, 0.0, 0.0], keys[2]]
+    assert [0, 40] == rb_animation_diff.get_changedInterval(keys, moved, 0, 100)
+
+    lastChanged = keys[:2] + [[40, 7.0, 0, 0.0, 0.0]]
+    assert [20, 100] == rb_animation_diff.get_changedInterval(keys, lastChanged, 0, 100)
+
+    added = keys[:2] + [[30, 5.0, 0, 0.0, 0.0]] + keys[2:]
+    assert [20, 40] == rb_animation_diff.get_changedInterval(keys, added, 0, 100)
+
+    # Clipped to the document range, or nothing if outside it
+    assert [10, 40] == rb_animation_diff.get_changedInterval(keys, moved, 10, 100)
+    assert None == rb_animation_diff.get_changedInterval(keys, lastChanged, 0, 10)
+
+# ===================================================================
+def check_diff_snapshots():
+# ===================================================================
+    # Only the tracks which changed give frames, whichever of two same
+    # named nodes they belong to
+    # .................................................................
+    rb_animation_diff._trackCache.clear()
+    doc = make_document()
+    oldSnapshot = rb_animation_diff.snapshot_tracks(doc)
+    assert [] == rb_animation_diff.diff_snapshots(oldSnapshot, rb_animation_diff.snapshot_tracks(doc), 0, 100)
+
+    doc.GetFirstObject().GetNext().GetCTracks()[0].setKeys([(0, 1.0), (30, 3.0), (60, 2.0)])
+    assert [[0, 60]] == rb_animation_diff.diff_snapshots(oldSnapshot, rb_animation_diff.snapshot_tracks(doc), 0, 100)
+
+    # A track which has gone changes the frames its keys covered
+    newSnapshot = dict(oldSnapshot)
+    del newSnapshot['mat:/Mat|Color . R']
+    assert [[0, 100]] == rb_animation_diff.diff_snapshots(oldSnapshot, newSnapshot, 0, 100)
+
+if __name__ == '__main__':
+    for check in [check_unique_keys, check_incremental_snapshot, check_changed_interval, check_diff_snapshots]:
+        check()
+        print(check.__name__ + ": ok")
@@ -0,0 +1,98 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+
+Description:
+    Runs the render pool against stand_in_render.py and checks the exit
+    code of each chunk, which chunks are reported as failed and the images
+    written.  The modules import c4d, so run it with the Python that comes
+    with Cinema 4D, e.g.
+
+        c4dpy check_render_pool.py
+"""
+
+import os, sys, time, tempfile
+
+toolsFolder = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(toolsFolder), 'modules'))
+
+import rb_render_pool, stand_in_render
+
+STAND_IN = os.path.join(toolsFolder, 'stand_in_render.py')
+
+# ===================================================================
+def make_pool(folder, takeJobs, processes, chunkCount=None):
+# ===================================================================
+    # The frames are split as if for the chunk count, or else the processes
+    projectFullPath = os.path.join(folder, 'shot.c4d')
+    open(projectFullPath, 'w').close()
+    chunks = rb_render_pool.split_render_chunks(takeJobs, processes if chunkCount is None else chunkCount)
+
+    return rb_render_pool.RenderPool(STAND_IN, projectFullPath, chunks, processes, 1, os.path.join(folder, 'logs'))
+
+# ===================================================================
+def check_exit_codes():
+# ===================================================================
+    # Three chunks, of which the second fails
+    # .......................................
+    with tempfile.TemporaryDirectory() as folder:
+        os.environ['STAND_IN_OUTPUT'] = os.path.join(folder, 'output')
+        os.environ['STAND_IN_FAIL_FRAME'] = '15'
+        renderPool = make_pool(folder, [(None, [[1, 30]])], 3)
+        renderPool.start()
+        assert True == renderPool.wait()
+
+        assert [[1, 10], [11, 20], [21, 30]] == [chunk.rangelet for chunk in renderPool.chunks]
+        assert [0, stand_in_render.FAIL_EXIT_CODE, 0] == [chunk.returnCode for chunk in renderPool.chunks]
+        assert [renderPool.chunks[1]] == renderPool.getFailedChunks()
+        assert (3, 0, 1) == renderPool.getCounts()
+        assert False == renderPool.isCancelled()
+        assert all(os.path.isfile(chunk.logPath) for chunk in renderPool.chunks)
+
+        rendered = sorted(os.listdir(os.environ['STAND_IN_OUTPUT']))
+        assert ['shot' + str(frame).zfill(4) + '.png' for frame in list(range(1, 11)) + list(range(21, 31))] == rendered
+
+# ===================================================================
+def check_stepped_chunks():
+# ===================================================================
+    # A stepped rangelet keeps its step in each chunk and renders no others
+    # .....................................................................
+    with tempfile.TemporaryDirectory() as folder:
+        os.environ['STAND_IN_OUTPUT'] = os.path.join(folder, 'output')
+        os.environ['STAND_IN_FAIL_FRAME'] = ''
+        renderPool = make_pool(folder, [(None, [[2, 62, 3]])], 2)
+        renderPool.start()
+        renderPool.wait()
+
+        assert [] == renderPool.getFailedChunks()
+        rendered = sorted(os.listdir(os.environ['STAND_IN_OUTPUT']))
+        assert ['shot' + str(frame).zfill(4) + '.png' for frame in range(2, 63, 3)] == rendered
+
+# ===================================================================
+def check_cancel():
+# ===================================================================
+    # Cancelling terminates the chunk running and skips those waiting,
+    # all of which count as failed
+    # ................................................................
+    with tempfile.TemporaryDirectory() as folder:
+        os.environ['STAND_IN_OUTPUT'] = os.path.join(folder, 'output')
+        os.environ['STAND_IN_FAIL_FRAME'] = ''
+        os.environ['STAND_IN_FRAME_SECONDS'] = '1'
+        renderPool = make_pool(folder, [(None, [[1, 30]])], 1, 3)
+        renderPool.start()
+        while 0 >= renderPool.getCounts()[1]:
+            time.sleep(0.01)
+        renderPool.cancel()
+        renderPool.wait()
+        os.environ['STAND_IN_FRAME_SECONDS'] = '0'
+
+        assert True == renderPool.isCancelled()
+        assert 0 != renderPool.chunks[0].returnCode and renderPool.chunks[0].returnCode is not None
+        assert [None, None] == [chunk.returnCode for chunk in renderPool.chunks[1:]]
+        assert renderPool.chunks == renderPool.getFailedChunks()
+
+if __name__ == '__main__':
+    for check in [check_exit_codes, check_stepped_chunks, check_cancel]:
+        check()
+        print(check.__name__ + ": ok")
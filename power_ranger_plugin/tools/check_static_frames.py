@@ -0,0 +1,175 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+
+Description:
+    Checks the linking of identical frames: the frame states hashed from a
+    fake document, the runs found in them, the image names of the link
+    plan and the links made in a temporary output folder, along with the
+    expiry of a plan whose first frames never render.  The modules import
+    c4d, so run it with the Python that comes with Cinema 4D, e.g.
+
+        c4dpy check_static_frames.py
+"""
+
+import os, sys, time, tempfile
+
+toolsFolder = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(toolsFolder), 'modules'))
+
+import c4d
+from c4d import documents
+import rb_static_frames, rb_job_journal
+from fake_document import FakeDocument, FakeNode, FakeTrack
+
+# ===================================================================
+def make_document():
+# ===================================================================
+    # A Cube which holds still from frame 20 to 40 and from 60 on, and a
+    # Sphere whose single key never changes it
+    # ..................................................................
+    return FakeDocument('shot.c4d', objects=[
+        FakeNode('Cube', tracks=[FakeTrack('Position . X', [(0, 0.0), (20, 5.0), (40, 5.0), (60, 7.0)])]),
+        FakeNode('Sphere', tracks=[FakeTrack('Position . Y', [(10, 3.0)])])
+    ])
+
+# ===================================================================
+def make_render_data(folder):
+# ===================================================================
+    # A document in the folder, saving Name0000.TIF images to renders/shot
+    # in it, with no multi-pass images
+    # ....................................................................
+    doc = documents.BaseDocument()
+    doc.SetDocumentPath(folder)
+    renderData = documents.RenderData()
+    renderData[c4d.RDATA_SAVEIMAGE] = True
+    renderData[c4d.RDATA_PATH] = 'renders/shot'
+    renderData[c4d.RDATA_NAMEFORMAT] = c4d.RDATA_NAMEFORMAT_0
+    renderData[c4d.RDATA_MULTIPASS_ENABLE] = False
+
+    return doc, renderData
+
+# ===================================================================
+def write_image(folder, fileName, mtime):
+# ===================================================================
+    fullPath = os.path.join(folder, fileName)
+    with open(fullPath, 'wb') as image:
+        image.write(fileName.encode('utf-8'))
+    os.utime(fullPath, (mtime, mtime))
+
+    return fullPath
+
+# ===================================================================
+def check_hash_frame_states():
+# ===================================================================
+    # Only the frames of the holds share a state, the single key is ignored
+    # .....................................................................
+    doc = make_document()
+    assert 1 == len(rb_static_frames.get_animated_curves(doc))
+
+    frameStates = rb_static_frames.hash_frame_states(doc, list(range(0, 71)))
+    assert 1 == len(set(frameStates[frame] for frame in range(20, 41)))
+    assert 1 == len(set(frameStates[frame] for frame in range(60, 71)))
+    assert frameStates[19] != frameStates[20] and frameStates[41] != frameStates[40]
+    assert frameStates[40] != frameStates[60]
+    assert 71 - 20 - 10 == len(set(frameStates.values()))
+
+# ===================================================================
+def check_find_static_runs():
+# ===================================================================
+    # Runs of two or more frames, broken by a missing frame
+    # .....................................................
+    doc = make_document()
+    frames = list(range(15, 31)) + list(range(35, 46)) + [60, 61, 63]
+    runs = rb_static_frames.find_static_runs(frames, rb_static_frames.hash_frame_states(doc, frames))
+    assert [list(range(20, 31)), list(range(35, 41)), [60, 61]] == runs, runs
+
+    assert [] == rb_static_frames.find_static_runs([20], {20: 'a'})
+
+# ===================================================================
+def check_build_link_plan():
+# ===================================================================
+    # The frames of each run are linked from the first, by image name.  The
+    # names are predicted through the token system, which needs a real
+    # document and render data
+    # .......................................................................
+    with tempfile.TemporaryDirectory() as folder:
+        doc, renderData = make_render_data(folder)
+        linkPlan = rb_static_frames.build_link_plan(doc, renderData, None, [[20, 21, 22], [30, 31]])
+
+        assert 1 == len(linkPlan)
+        assert os.path.join(folder, 'renders') == linkPlan[0]['folder']
+        assert True == linkPlan[0]['hasExtension']
+        assert [['shot0020', 'shot0021'], ['shot0020', 'shot0022'], ['shot0030', 'shot0031']] == sorted(linkPlan[0]['links'])
+
+# ===================================================================
+def check_apply_link_plans():
+# ===================================================================
+    # Only a first frame rendered since the submission is linked, and the
+    # plan is resolved once every image is in place
+    # ...................................................................
+    with tempfile.TemporaryDirectory() as folder:
+        rb_job_journal.JOURNAL_FILE = os.path.join(folder, 'journal.jsonl')
+        projectFullPath = os.path.join(folder, 'shot.c4d')
+        outputFolder = os.path.join(folder, 'renders')
+        os.makedirs(outputFolder)
+
+        doc, renderData = make_render_data(folder)
+        linkPlan = rb_static_frames.build_link_plan(doc, renderData, None, [[20, 21, 22], [30, 31]])
+        submitTime = time.time() - 60
+        jobId = rb_job_journal.record_submission(projectFullPath, outputFolder, 'shot', [[20, 31]], [])
+        rb_job_journal.record_link_plan(projectFullPath, linkPlan, [jobId], submitTime)
+
+        # Frame 20 has rendered, frame 30 is left from an earlier render
+        sourceFullPath = write_image(outputFolder, 'shot0020.tif', submitTime + 10)
+        staleFullPath = write_image(outputFolder, 'shot0030.tif', submitTime - 10)
+
+        assert 2 == rb_static_frames.apply_link_plans(projectFullPath)
+        for fileName in ['shot0021.tif', 'shot0022.tif']:
+            assert os.path.samefile(sourceFullPath, os.path.join(outputFolder, fileName))
+        assert False == os.path.exists(os.path.join(outputFolder, 'shot0031.tif'))
+        assert 1 == len(rb_job_journal.get_pending_link_plans(projectFullPath))
+
+        # Linked images are not linked again
+        assert 0 == rb_static_frames.apply_link_plans(projectFullPath)
+
+        # Once frame 30 has rendered again the plan is done with
+        os.utime(staleFullPath, (submitTime + 20, submitTime + 20))
+        assert 1 == rb_static_frames.apply_link_plans(projectFullPath)
+        assert os.path.samefile(staleFullPath, os.path.join(outputFolder, 'shot0031.tif'))
+        assert [] == rb_job_journal.get_pending_link_plans(projectFullPath)
+
+# ===================================================================
+def check_expire_link_plans():
+# ===================================================================
+    # A plan whose first frames never render is kept while its job may
+    # still render them, then dropped once the job is done with
+    # ................................................................
+    with tempfile.TemporaryDirectory() as folder:
+        rb_job_journal.JOURNAL_FILE = os.path.join(folder, 'journal.jsonl')
+        projectFullPath = os.path.join(folder, 'shot.c4d')
+        outputFolder = os.path.join(folder, 'renders')
+        os.makedirs(outputFolder)
+
+        doc, renderData = make_render_data(folder)
+        linkPlan = rb_static_frames.build_link_plan(doc, renderData, None, [[20, 21, 22]])
+        jobId = rb_job_journal.record_submission(projectFullPath, outputFolder, 'shot', [[20, 22]], [])
+        rb_job_journal.record_link_plan(projectFullPath, linkPlan, [jobId], time.time())
+
+        assert 0 == rb_static_frames.apply_link_plans(projectFullPath)
+        assert 1 == len(rb_job_journal.get_pending_link_plans(projectFullPath))
+
+        # Finished, but a fill loop may render the frame again
+        rb_job_journal.record_completion(jobId)
+        assert 0 == rb_static_frames.apply_link_plans(projectFullPath, expirePlans=False)
+        assert 1 == len(rb_job_journal.get_pending_link_plans(projectFullPath))
+
+        assert 0 == rb_static_frames.apply_link_plans(projectFullPath)
+        assert [] == rb_job_journal.get_pending_link_plans(projectFullPath)
+
+if __name__ == '__main__':
+    for check in [check_hash_frame_states, check_find_static_runs, check_build_link_plan,
+                  check_apply_link_plans, check_expire_link_plans]:
+        check()
+        print(check.__name__ + ": ok")
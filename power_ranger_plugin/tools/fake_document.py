@@ -0,0 +1,175 @@
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+
+Description:
+    A small stand-in for the parts of the Cinema 4D document model which
+    the animation analysis reads: a document holding objects, tags and
+    materials, each with animation tracks whose curves have keys.  Curves
+    are linear between keys.  Used by the check scripts, e.g.
+
+        doc = FakeDocument('shot.c4d', objects=[
+            FakeNode('Cube', tracks=[FakeTrack('Position . X', [(0, 0.0), (20, 5.0)])])
+        ])
+"""
+
+# Frames per second of every fake document and curve
+FPS = 25
+
+# ===================================================================
+class FakeTime(object):
+# ===================================================================
+    """ A key time, as a frame at the fake frame rate """
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def GetFrame(self, fps):
+        return self.frame * fps // FPS
+
+    def Get(self):
+        return float(self.frame) / FPS
+
+# ===================================================================
+class FakeKey(object):
+# ===================================================================
+
+    def __init__(self, frame, value, interpolation=0):
+        self.frame = frame
+        self.value = value
+        self.interpolation = interpolation
+
+    def GetTime(self):
+        return FakeTime(self.frame)
+
+    def GetValue(self):
+        return self.value
+
+    def GetInterpolation(self):
+        return self.interpolation
+
+    def GetValueLeft(self):
+        return 0.0
+
+    def GetValueRight(self):
+        return 0.0
+
+# ===================================================================
+class FakeCurve(object):
+# ===================================================================
+    """
+    Keys of (frame, value), held at the first and last key and linear
+    between them
+    """
+
+    def __init__(self, keys):
+        self.keys = [FakeKey(frame, value) for frame, value in sorted(keys)]
+
+    def GetKeyCount(self):
+        return len(self.keys)
+
+    def GetKey(self, idx):
+        return self.keys[idx]
+
+    def GetValue(self, time):
+        # Takes a BaseTime, or anything else with Get() in seconds
+        frame = round(time.Get() * FPS)
+        if 0 >= len(self.keys):
+            return 0.0
+        if frame <= self.keys[0].frame:
+            return self.keys[0].value
+        for left, right in zip(self.keys, self.keys[1:]):
+            if frame <= right.frame:
+                return left.value + (right.value - left.value) * (frame - left.frame) / (right.frame - left.frame)
+
+        return self.keys[-1].value
+
+# ===================================================================
+class FakeTrack(object):
+# ===================================================================
+    """ A named track whose dirty count moves on each time its keys are set """
+
+    def __init__(self, name, keys):
+        self.name = name
+        self.curve = FakeCurve(keys)
+        self.dirty = 1
+
+    def setKeys(self, keys):
+        self.curve = FakeCurve(keys)
+        self.dirty += 1
+
+    def GetName(self):
+        return self.name
+
+    def GetCurve(self):
+        return self.curve
+
+    def GetDirty(self, flags):
+        return self.dirty
+
+# ===================================================================
+class FakeNode(object):
+# ===================================================================
+    """ An object, tag or material, linked to its siblings and children """
+
+    def __init__(self, name, tracks=(), children=(), tags=()):
+        self.name = name
+        self.tracks = list(tracks)
+        self.tags = list(tags)
+        self.next = None
+        self.down = link_siblings(children)
+
+    def GetName(self):
+        return self.name
+
+    def GetNext(self):
+        return self.next
+
+    def GetDown(self):
+        return self.down
+
+    def GetTags(self):
+        return self.tags
+
+    def GetCTracks(self):
+        return self.tracks
+
+# ===================================================================
+def link_siblings(nodes):
+# ===================================================================
+    # Links the nodes one after another and returns the first, or None
+    # ..................................................................
+    for node, nextNode in zip(nodes, list(nodes)[1:]):
+        node.next = nextNode
+
+    return nodes[0] if 0 < len(nodes) else None
+
+# ===================================================================
+class FakeDocument(object):
+# ===================================================================
+    """ A document of objects and materials, with no takes """
+
+    def __init__(self, name, objects=(), materials=(), path=''):
+        self.name = name
+        self.path = path
+        self.firstObject = link_siblings(list(objects))
+        self.firstMaterial = link_siblings(list(materials))
+
+    def GetDocumentName(self):
+        return self.name
+
+    def GetDocumentPath(self):
+        return self.path
+
+    def GetFps(self):
+        return FPS
+
+    def GetFirstObject(self):
+        return self.firstObject
+
+    def GetFirstMaterial(self):
+        return self.firstMaterial
+
+    def GetTakeData(self):
+        return None
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Application:    Power Ranger Plugin
+Copyright:      PowerHouse Industries Nov 2023
+Author:         Brian Etheridge
+
+Description:
+    Stands in for the Cinema 4D Commandline renderer, so that the render
+    pool can be checked without a render licence.  Takes the same
+    arguments, e.g.
+
+        stand_in_render.py -nogui -render shot.c4d -frame 100 149 1 -threads 16
+
+    and writes an empty image named after the project for each frame, e.g.
+    shot0100.png, into the STAND_IN_OUTPUT folder.  Exits with code 3 if the
+    frames include STAND_IN_FAIL_FRAME, and sleeps STAND_IN_FRAME_SECONDS per
+    frame to give a render time to cancel.
+"""
+
+import os, sys, time
+
+FAIL_EXIT_CODE = 3
+
+# ===================================================================
+def get_argument(name, count=1):
+# ===================================================================
+    idx = sys.argv.index(name)
+    return sys.argv[idx + 1: idx + 1 + count]
+
+# ===================================================================
+def main():
+# ===================================================================
+    projectName = os.path.splitext(os.path.basename(get_argument('-render')[0]))[0]
+    frameFrom, frameTo, step = [int(arg) for arg in get_argument('-frame', 3)]
+    outputFolder = os.environ.get('STAND_IN_OUTPUT', os.getcwd())
+    failFrame = os.environ.get('STAND_IN_FAIL_FRAME', '')
+    frameSeconds = float(os.environ.get('STAND_IN_FRAME_SECONDS', '0'))
+
+    print("Rendering frames " + str(frameFrom) + " to " + str(frameTo) + " step " + str(step))
+    frames = range(frameFrom, frameTo + 1, step)
+    if failFrame.lstrip('-').isdigit() and int(failFrame) in frames:
+        print("Failed to render frame " + failFrame)
+        return FAIL_EXIT_CODE
+
+    os.makedirs(outputFolder, exist_ok=True)
+    for frame in frames:
+        time.sleep(frameSeconds)
+        open(os.path.join(outputFolder, projectName + str(frame).zfill(4) + '.png'), 'w').close()
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())